@@ -1,11 +1,14 @@
 from abc import ABC, abstractmethod
-from typing import Any, List
+from typing import Any, List, AsyncIterator, Awaitable, Callable
 import asyncio
 import uuid
 import json
 import time
 import sys
-from threading import Timer
+import heapq
+import math
+import random
+from threading import Thread, Timer
 from collections import deque
 
 
@@ -165,6 +168,89 @@ class EventHandler(ABC):
         return self.toJSON()
 
 
+class ProcessingStats:
+    """
+    Running statistics of processing times ("time" - "initTime", in absolute value) of events, updated online with Welford's algorithm.
+    Optionally windowed: only the last "windowSize" processing times are considered.
+    Percentiles are computed from the window or, without a window, estimated from a uniform sample (reservoir sampling) of the processing times.
+    """
+
+    def __init__(self, windowSize: int = None, sampleSize: int = 1024):
+        """
+        Constructor:
+        @param windowSize: (optional) Number of latest processing times considered. Default: all.
+        @param sampleSize: Size of the sample used to estimate percentiles without a window.
+        """
+        self.windowSize = windowSize
+        self.sampleSize = sampleSize
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = None
+        self.max = None
+        self._window: deque[float] = deque()
+        self._sample: List[float] = []
+        self._seen = 0
+        self._random = random.Random(0)
+
+    def add(self, event: Event) -> None:
+        value = abs(event.time - event.initTime)
+        if (self.windowSize is not None):
+            self._window.append(value)
+            if (len(self._window) > self.windowSize):
+                self._remove(self._window.popleft())
+        else:
+            self._seen += 1
+            if (len(self._sample) < self.sampleSize):
+                self._sample.append(value)
+            else:
+                i = self._random.randrange(self._seen)
+                if (i < self.sampleSize):
+                    self._sample[i] = value
+            if (self.min is None) or (value < self.min):
+                self.min = value
+            if (self.max is None) or (value > self.max):
+                self.max = value
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+    def _remove(self, value: float) -> None:
+        self.count -= 1
+        if (self.count == 0):
+            self.mean = 0.0
+            self._m2 = 0.0
+            return
+        delta = value - self.mean
+        self.mean -= delta / self.count
+        self._m2 = max(self._m2 - delta * (value - self.mean), 0.0)
+
+    def summary(self, percentiles: List[float] = (50, 90, 99)) -> dict:
+        """
+        @param percentiles: Percentiles (0 to 100) to compute.
+        @return: A dict, as in the example: {'count': 10, 'mean': 5.0, 'stdDev': 1.2, 'min': 3, 'max': 8, 'percentiles': {50: 5, 90: 7, 99: 8}}.
+                 Without events, the mean is 0 and the other statistics are None.
+        """
+        values = sorted(self._window if self.windowSize is not None else self._sample)
+        res = {'count': self.count, 'mean': self.mean, 'stdDev': None, 'min': None, 'max': None,
+               'percentiles': {p: None for p in percentiles}}
+        if (self.count == 0):
+            return res
+        res['stdDev'] = math.sqrt(self._m2 / self.count)
+        if (self.windowSize is not None):
+            res['min'] = values[0]
+            res['max'] = values[-1]
+        else:
+            res['min'] = self.min
+            res['max'] = self.max
+        for p in percentiles:
+            # Nearest rank.
+            res['percentiles'][p] = values[min(len(values) - 1,
+                                               max(0, math.ceil(p / 100 * len(values)) - 1))]
+        return res
+
+
 class History(ABC):
     """
     This class represents a way to save events.
@@ -216,6 +302,11 @@ class History(ABC):
                             'topics': (List) topics,
                             'times': (List) Event times,
                             'valuesHashes': (List) event values hashes,
+                            'valueWhere': (List) Predicates on fields of the event values (all must be satisfied), as in the example:
+                                          [{'path': 'amount', 'op': '>', 'value': 100}, {'path': 'coord', 'op': '==', 'value': [3, 4]}]
+                                          'path' is a dotted path ('victims.0.bpm') or a list of keys/indexes. 'op' is one of '==', '!=', '<', '<=', '>', '>=', 'in' (value is a list) or 'exists'.
+                                          Numbers are compared by value, other values by their canonical JSON. Ordering operators compare only numbers with numbers and strings with strings.
+                                          Events whose value does not have the path do not satisfy the predicate (except for {'op': 'exists', 'value': False}).
                             'minTime': Lower limit for time (in nanoseconds), compared to the initTime of events.
                             'maxTime': Upper limit for time (in nanoseconds), compared to the time of events
                             'limit': Maximum number of events to return,
@@ -237,6 +328,236 @@ class History(ABC):
         """
         pass
 
+    async def iterEventsAsync(self, filters: dict, batchSize: int = 1000) -> AsyncIterator[Event]:
+        """
+        Streams the events that satisfy the filters, so that memory does not grow with the size of the result.
+        The default implementation pages through "getEventsAsync" with the 'cursor' and 'limit' filters (so event ids must be unique).
+        Implementations are encouraged to override it with a native streaming.
+        @param filters: Same filters as "getEventsAsync".
+        @param batchSize: Number of events recovered by each call to "getEventsAsync".
+        @return: An async generator of events (Event instances), in the same order as "getEventsAsync".
+        """
+        filters = dict(filters)
+        remaining = sys.maxsize
+        if ('limit' in filters):
+            remaining = filters['limit']
+        while (remaining > 0):
+            limit = min(batchSize, remaining)
+            filters['limit'] = limit
+            batch: List[Event] = await self.getEventsAsync(filters)
+            for event in batch:
+                yield event
+            remaining -= len(batch)
+            if (len(batch) < limit):
+                break
+            filters['cursor'] = batch[-1].id
+
+    async def exportToAsync(self, path: str) -> None:
+        """
+        Exports all the events to a file, in a compact binary format (topics and values are dictionary-encoded, and the stream is compressed).
+        Events are streamed (see "iterEventsAsync"), so memory is bounded. The file can be imported by any History implementation.
+        @param path: File path.
+        """
+        from .serialization import BinaryHistoryWriter
+        with open(path, 'wb') as file:
+            writer = BinaryHistoryWriter(file)
+            async for event in self.iterEventsAsync({}):
+                writer.write(event)
+            writer.close()
+
+    async def importFromAsync(self, path: str) -> None:
+        """
+        Adds to this History the events of a file created by "exportToAsync", as a stream.
+        @param path: File path.
+        """
+        from .serialization import BinaryHistoryReader
+        with open(path, 'rb') as file:
+            for event in BinaryHistoryReader(file):
+                await self.addEventAsync(event)
+        await self.flushAsync()
+
+    async def aggregateAsync(self, topics: List[str], bucketNs: int, minTime: int = 0, maxTime: int = sys.maxsize) -> dict[str, dict[int, dict]]:
+        """
+        Counts the events of each topic per time bucket, and per value hash.
+        The default implementation streams the events (see "iterEventsAsync"). Implementations are encouraged to serve it from maintained rollups.
+        @param topics: (List) topics.
+        @param bucketNs: Size of the buckets, in nanoseconds. Events are assigned to buckets by their "time". A ValueError is raised if it is not positive.
+        @param minTime: Minimum time (in nanoseconds), compared to the initTime of events (as in "getEventsAsync").
+        @param maxTime: Maximum time (in nanoseconds), compared to the time of events.
+        @return: A dict, as in the example (only topics and buckets with events are included): {
+                                                                                                  'topic1': {
+                                                                                                    1000000000: {'count': 3, 'values': {'hash1': 2, 'hash2': 1}},
+                                                                                                    2000000000: {'count': 1, 'values': {'hash1': 1}}
+                                                                                                  }
+                                                                                                }
+        """
+        History._checkBucket(bucketNs)
+        res: dict[str, dict[int, dict]] = dict()
+        async for event in self.iterEventsAsync({'topics': topics, 'minTime': minTime, 'maxTime': maxTime}):
+            buckets = res.setdefault(event.topic, dict())
+            bucket = buckets.setdefault(
+                (event.time // bucketNs) * bucketNs, {'count': 0, 'values': dict()})
+            valueHash = await self.hashAsync(event.value)
+            bucket['count'] += 1
+            bucket['values'][valueHash] = bucket['values'].get(valueHash, 0) + 1
+        return res
+
+    @staticmethod
+    def _checkBucket(bucketNs: int) -> None:
+        if (bucketNs <= 0):
+            raise ValueError(f'bucketNs must be positive, got {bucketNs}.')
+
+    async def stateAtAsync(self, time: int, topics: List[str] = None) -> dict[str, Event]:
+        """
+        Reconstructs the state at an instant: the latest event of each topic with "time" <= the given time.
+        If several events of a topic have that time, the last saved one is returned.
+        The default implementation streams the events (see "iterEventsAsync"). Implementations are encouraged to use indexes or checkpoints.
+        @param time: Instant (in nanoseconds).
+        @param topics: (optional) (List) topics. Default: all topics.
+        @return: A dict: topic -> Event. Topics without events until the instant are not included.
+        """
+        filters: dict = {'maxTime': time}
+        if (topics is not None):
+            filters['topics'] = topics
+        res: dict[str, Event] = dict()
+        async for event in self.iterEventsAsync(filters):
+            if (not event.topic in res) or (event.time >= res[event.topic].time):
+                res[event.topic] = event
+        return res
+
+    async def processingStatsAsync(self, topic: str, minTime: int = 0, maxTime: int = sys.maxsize) -> dict:
+        """
+        Statistics of the processing times ("time" - "initTime", in absolute value) of the events of a topic, for example, the latency of the handlers that publish it.
+        The default implementation streams the events (see "iterEventsAsync"). Implementations are encouraged to maintain them as events are saved (see "ProcessingStats").
+        @param topic: Topic.
+        @param minTime: Minimum time (in nanoseconds), compared to the initTime of events (as in "getEventsAsync").
+        @param maxTime: Maximum time (in nanoseconds), compared to the time of events.
+        @return: The summary of a ProcessingStats (see "ProcessingStats.summary").
+        """
+        stats = ProcessingStats()
+        async for event in self.iterEventsAsync({'topics': [topic], 'minTime': minTime, 'maxTime': maxTime}):
+            stats.add(event)
+        return stats.summary()
+
+    async def flushAsync(self) -> None:
+        """
+        Makes sure that all the events received so far are saved.
+        Implementations that delay writes (for example, buffering them) must override this method. By default, it does nothing.
+        """
+        pass
+
+    async def _satisfiesFiltersAsync(self, event: Event, filters: dict, valueHash: str = None) -> bool:
+        """
+        Checks an event against the recommended filters ('ids', 'topics', 'times', 'valuesHashes', 'valueWhere', 'minTime' and 'maxTime').
+        The 'cursor' and 'limit' filters depend on the order of the events, so they are applied by the implementations.
+        @param event: Instance of class Event.
+        @param filters: Filters, as described in "getEventsAsync".
+        @param valueHash: (optional) Hash of the event value, if the implementation already knows it.
+        @return: True if the event satisfies the filters.
+        """
+        if ('ids' in filters):
+            if (not event.id in filters['ids']):
+                return False
+        if ('topics' in filters):
+            if (not event.topic in filters['topics']):
+                return False
+        if ('times' in filters):
+            if (not event.time in filters['times']):
+                return False
+        if ('minTime' in filters):
+            if (event.initTime < filters['minTime']):
+                return False
+        if ('maxTime' in filters):
+            if (event.time > filters['maxTime']):
+                return False
+        if ('valuesHashes' in filters):
+            if (valueHash is None):
+                valueHash = await self.hashAsync(event.value)
+            if (not valueHash in filters['valuesHashes']):
+                return False
+        if ('valueWhere' in filters):
+            if (not History._satisfiesValueWhere(event.value, filters['valueWhere'])):
+                return False
+        return True
+
+    @staticmethod
+    def _valueAt(value: Any, path: str | List) -> tuple[bool, Any]:
+        """
+        Finds a field of an event value.
+        @param value: Event value.
+        @param path: Dotted path ('victims.0.bpm') or list of keys/indexes.
+        @return: A tuple (found, field value).
+        """
+        if (isinstance(path, str)):
+            path = path.split('.') if path != '' else []
+        for key in path:
+            if (isinstance(value, dict)):
+                if (not key in value):
+                    return False, None
+                value = value[key]
+            elif (isinstance(value, (list, tuple))):
+                try:
+                    value = value[int(key)]
+                except (ValueError, IndexError):
+                    return False, None
+            elif (hasattr(value, '__dict__') and isinstance(key, str) and key in value.__dict__):
+                value = value.__dict__[key]
+            else:
+                return False, None
+        return True, value
+
+    @staticmethod
+    def _isNumber(value: Any) -> bool:
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+    @staticmethod
+    def _canonicalValue(value: Any) -> str:
+        """
+        Canonical JSON of a value (sorted keys, no spaces), used to compare non-numeric fields in 'valueWhere'.
+        """
+        return json.dumps(value, sort_keys=True, separators=(',', ':'), ensure_ascii=False,
+                          default=lambda o: dict(o) if isinstance(o, (Event, EventHandler)) else getattr(o, '__dict__', repr(o)))
+
+    @staticmethod
+    def _valueEquals(a: Any, b: Any) -> bool:
+        if (History._isNumber(a) and History._isNumber(b)):
+            return a == b
+        if (History._isNumber(a) or History._isNumber(b)):
+            return False
+        return History._canonicalValue(a) == History._canonicalValue(b)
+
+    @staticmethod
+    def _satisfiesValueWhere(value: Any, predicates: List[dict]) -> bool:
+        """
+        Checks an event value against the predicates of the 'valueWhere' filter (see "getEventsAsync").
+        """
+        for predicate in predicates:
+            op = predicate.get('op', '==')
+            found, field = History._valueAt(value, predicate['path'])
+            if (op == 'exists'):
+                if (found != predicate.get('value', True)):
+                    return False
+                continue
+            if (not found):
+                return False
+            expected = predicate.get('value')
+            if (op == '=='):
+                ok = History._valueEquals(field, expected)
+            elif (op == '!='):
+                ok = not History._valueEquals(field, expected)
+            elif (op == 'in'):
+                ok = any(History._valueEquals(field, e) for e in expected)
+            elif (op in ('<', '<=', '>', '>=')):
+                comparable = (History._isNumber(field) and History._isNumber(expected)) or \
+                    (isinstance(field, str) and isinstance(expected, str))
+                ok = comparable and ((op == '<' and field < expected) or (op == '<=' and field <= expected) or
+                                     (op == '>' and field > expected) or (op == '>=' and field >= expected))
+            else:
+                raise Exception(f'Unknown operator {op} in valueWhere.')
+            if (not ok):
+                return False
+        return True
+
     def addEvent(self, event: Event) -> None:
         """
         Wraps the "addEventAsync" method for synchronous calls
@@ -255,6 +576,42 @@ class History(ABC):
         """
         return asyncio.run(self.countOutsAsync(handlers))
 
+    def aggregate(self, topics: List[str], bucketNs: int, minTime: int = 0, maxTime: int = sys.maxsize) -> dict[str, dict[int, dict]]:
+        """
+        Wraps the "aggregateAsync" method for synchronous calls
+        """
+        return asyncio.run(self.aggregateAsync(topics, bucketNs, minTime, maxTime))
+
+    def stateAt(self, time: int, topics: List[str] = None) -> dict[str, Event]:
+        """
+        Wraps the "stateAtAsync" method for synchronous calls
+        """
+        return asyncio.run(self.stateAtAsync(time, topics))
+
+    def processingStats(self, topic: str, minTime: int = 0, maxTime: int = sys.maxsize) -> dict:
+        """
+        Wraps the "processingStatsAsync" method for synchronous calls
+        """
+        return asyncio.run(self.processingStatsAsync(topic, minTime, maxTime))
+
+    def flush(self) -> None:
+        """
+        Wraps the "flushAsync" method for synchronous calls
+        """
+        return asyncio.run(self.flushAsync())
+
+    def exportTo(self, path: str) -> None:
+        """
+        Wraps the "exportToAsync" method for synchronous calls
+        """
+        return asyncio.run(self.exportToAsync(path))
+
+    def importFrom(self, path: str) -> None:
+        """
+        Wraps the "importFromAsync" method for synchronous calls
+        """
+        return asyncio.run(self.importFromAsync(path))
+
 
 class EventBroker(ABC):
     """
@@ -348,9 +705,29 @@ class EventBroker(ABC):
             if (event.initTime == 0):
                 event.initTime = event.time
             self.history.addEvent(event)
+            self._notifyListeners(event)
             for subscriber in self.subscribers([event.topic]):
                 subscriber.addEventToQueue(event)
 
+    def addListener(self, listener: Callable[[Event], None]) -> None:
+        """
+        Registers a function that is called with each event published in the broker (outputs of handlers and external events), right after it is saved in the history.
+        Listeners are called from the threads that process the handlers, so they must be fast and thread-safe.
+        @param listener: Function that receives an Event instance.
+        """
+        self.listeners.append(listener)
+
+    def removeListener(self, listener: Callable[[Event], None]) -> None:
+        """
+        Unregisters a function registered with "addListener".
+        @param listener: The registered function.
+        """
+        self.listeners.remove(listener)
+
+    def _notifyListeners(self, event: Event) -> None:
+        for listener in list(self.listeners):
+            listener(event)
+
     def __init__(self, handlers: List[EventHandler], history: History, delay: float = 0.5):
         """
         Constructor:
@@ -363,6 +740,7 @@ class EventBroker(ABC):
         self.delay = delay
         self._timer = None
         self.runningInTimer = False
+        self.listeners: List[Callable[[Event], None]] = []
 
     def _processLayer(self, handlers: EventHandler) -> None:
         """
@@ -399,7 +777,7 @@ class EventBroker(ABC):
         4 - Determines the time that processing finished.
         5 - Fill times in Handler output events.
         6 - Defines that the Handler is a publisher of the output topics.
-        7 - Adds the Handler's output events to the history.
+        7 - Adds the Handler's output events to the history, and notifies the listeners (see "addListener").
         8 - Delivers output events from Handler to subscribers.
         """
         initTime = time.time_ns()
@@ -411,6 +789,7 @@ class EventBroker(ABC):
             e.time = endTime
             handler.publish([e.topic])
             await self.history.addEventAsync(e)
+            self._notifyListeners(e)
             for subscriber in self.subscribers([e.topic]):
                 subscriber.addEventToQueue(e)
 
@@ -425,10 +804,20 @@ class EventBroker(ABC):
     def stopProcess(self) -> None:
         """
         Stops calls to the processing cycle.
+        Events that the history has not saved yet (for example, buffered writes) are flushed.
         """
         if (self._timer):
             self._timer.cancel()
         self.runningInTimer = False
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self.history.flush()
+            return
+        # Called from a coroutine: "flush" cannot start an event loop in this thread.
+        flushing = Thread(target=self.history.flush)
+        flushing.start()
+        flushing.join()
 
 
 class Explainer(ABC):
@@ -436,13 +825,30 @@ class Explainer(ABC):
     Represents an explanation generator.
     """
 
-    def __init__(self, eventBroker: EventBroker, history: History):
+    def __init__(self, eventBroker: EventBroker, history: History, concurrency: int = 8):
         """
         Constructor:
         @param history: Object responsible for saving processing events.
+        @param concurrency: Maximum number of lookups in the history run concurrently by a query (see "_gatherAsync").
         """
         self.history = history
         self.eventBroker = eventBroker
+        self.concurrency = concurrency
+
+    async def _gatherAsync(self, lookups: dict[Any, Callable[[], Awaitable[Any]]]) -> dict[Any, Any]:
+        """
+        Runs independent lookups (for example, in the history) concurrently, at most "self.concurrency" at a time.
+        @param lookups: Functions that start each lookup, by key. Identical lookups of a query must have the same key, so that they run once.
+        @return: Results by key.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run(lookup: Callable[[], Awaitable[Any]]) -> Any:
+            async with semaphore:
+                return await lookup()
+        keys = list(lookups)
+        results = await asyncio.gather(*[run(lookups[key]) for key in keys])
+        return dict(zip(keys, results))
 
     async def hashesToValue(self, prData: dict[str, dict[str, float]]) -> dict[str, Any]:
         """
@@ -459,11 +865,11 @@ class Explainer(ABC):
         @return: Map of hashes to causes or effect values, ex:
                 { "eventValueHash1": value1, ... }
         """
-        res = dict()
+        lookups = dict()
         for topic in prData:
             for eventValueHash in prData[topic]:
-                res[eventValueHash] = await self.history.objByHashAsync(eventValueHash)
-        return res
+                lookups[eventValueHash] = lambda h=eventValueHash: self.history.objByHashAsync(h)
+        return await self._gatherAsync(lookups)
 
     def normalizeProbs(self, prData: dict[str, dict[str, float]]) -> None:
         """
@@ -486,6 +892,24 @@ class Explainer(ABC):
             for eventValueHash in prData[topic]:
                 prData[topic][eventValueHash] = prData[topic][eventValueHash]/total
 
+    @staticmethod
+    def topKProbs(prData: dict[str, dict[str, float]], topK: int = None, normalize: bool = False) -> dict[str, dict[str, float]]:
+        """
+        Keeps only the most probable value hashes of each topic.
+        @param prData: probability hashs dict (see "possibleCausesAsync").
+        @param topK: Number of value hashes kept per topic. On equal probabilities, the smallest value hashes are kept, so the result does not depend on the order of the dict. None keeps all.
+        @param normalize: If True, the kept probabilities are normalized over the whole distribution (as "normalizeProbs" would do before removing the others).
+        @return: A new probability dict, or the same one if "topK" is None and "normalize" is False.
+        """
+        if (topK is None) and (not normalize):
+            return prData
+        total = 1
+        if (normalize):
+            total = sum(p for topic in prData for p in prData[topic].values())
+        if (topK is None):
+            return {topic: {h: p / total for h, p in prData[topic].items()} for topic in prData}
+        return {topic: {h: p / total for h, p in heapq.nsmallest(topK, prData[topic].items(), key=lambda item: (-item[1], item[0]))} for topic in prData}
+
     @abstractmethod
     async def causesOfAsync(self, effects: List[Event], minTime: int = 0, maxTime: int = sys.maxsize) -> List[Event]:
         """
@@ -509,12 +933,14 @@ class Explainer(ABC):
         pass
 
     @abstractmethod
-    async def possibleCausesAsync(self, effects: List[Event], minTime: int = 0, maxTime: int = sys.maxsize) -> dict[str, dict[str, float]]:
+    async def possibleCausesAsync(self, effects: List[Event], minTime: int = 0, maxTime: int = sys.maxsize, topK: int = None, normalize: bool = False) -> dict[str, dict[str, float]]:
         """
         Returns the probabilities of possible causes for one or more effects.
         @param effects: Effect events for which probabilities will be calculated.
         @param minTime: Minimum time (in nanoseconds) to consider the calculation.
         @param maxTime: Maximum time (in nanoseconds) to consider the calculation.
+        @param topK: (optional) Only the "topK" most probable value hashes of each topic are returned (see "topKProbs").
+        @param normalize: If True, probabilities are normalized over the whole distribution, before the "topK" ones are kept (see "topKProbs").
         @return: A probability dictionary, as in the example: 
                 {
                   "topic1": {
@@ -538,12 +964,14 @@ class Explainer(ABC):
         pass
 
     @abstractmethod
-    async def possibleEffectsAsync(self, causes: List[Event], minTime: int = 0, maxTime: int = sys.maxsize) -> dict[str, dict[str, float]]:
+    async def possibleEffectsAsync(self, causes: List[Event], minTime: int = 0, maxTime: int = sys.maxsize, topK: int = None, normalize: bool = False) -> dict[str, dict[str, float]]:
         """
         Returns the probabilities of possible effects for one or more causes.
         @param causes: Cause events for which probabilities will be calculated.
         @param minTime: Minimum time (in nanoseconds) to consider the calculation.
         @param maxTime: Maximum time (in nanoseconds) to consider the calculation.
+        @param topK: (optional) Only the "topK" most probable value hashes of each topic are returned (see "topKProbs").
+        @param normalize: If True, probabilities are normalized over the whole distribution, before the "topK" ones are kept (see "topKProbs").
         @return: A probability dictionary, as in the example: 
                 {
                   "topic1": {
@@ -583,6 +1011,80 @@ class Explainer(ABC):
         """
         pass
 
+    async def explainChainAsync(self, events: List[Event], depth: int = 1, direction: str = 'causes', minProb: float = 0.0, maxFanout: int = None, minTime: int = 0, maxTime: int = sys.maxsize) -> dict:
+        """
+        Expands the possible causes and/or effects of events for several levels at once, as the WebGUI does one level at a time.
+        Each distinct (topic, value hash) is a node of the chain and is expanded only once, even if it is reached from several events or levels.
+        The probabilities of each expansion are normalized (see "normalizeProbs") before being pruned. Only the "maxFanout" most probable values of each topic are requested.
+        @param events: Events at level 0 of the chain.
+        @param depth: Number of levels expanded from the events.
+        @param direction: 'causes' (levels -1, -2, ...), 'effects' (levels 1, 2, ...) or 'both'. With 'both', causes are expanded only towards causes and effects only towards effects.
+        @param minProb: Minimum normalized probability of the causes or effects kept in the chain.
+        @param maxFanout: Maximum number of causes or effects kept per expanded node (the most probable ones). None keeps all.
+        @param minTime: Minimum time (in nanoseconds) to consider the calculation.
+        @param maxTime: Maximum time (in nanoseconds) to consider the calculation.
+        @return: Nodes by topic and value hash (with an event filled by "fillCauseAsync" or "fillEffectAsync", and its level), and the edges from causes to effects, ex:
+                {
+                  "nodes": {
+                              "topic1": {
+                                          "eventValueHash1": {"event": event, "level": -1},
+                                          ...
+                                        },
+                              ...
+                           },
+                  "edges": [
+                              {"cause": ["topic1", "eventValueHash1"], "effect": ["topic2", "eventValueHash2"], "probability": probability},
+                              ...
+                           ]
+                }
+        """
+        if (not direction in ('causes', 'effects', 'both')):
+            raise Exception(f'Unknown direction {direction}.')
+        directions = ['causes', 'effects'] if direction == 'both' else [direction]
+        nodes: dict[str, dict[str, dict]] = dict()
+        edges: List[dict] = list()
+        # Nodes to expand in the next level: (event, value hash, directions).
+        frontier: List[tuple[Event, str, List[str]]] = list()
+        for event in events:
+            valueHash = await self.history.hashAsync(event.value)
+            if (valueHash in nodes.get(event.topic, {})):
+                continue
+            nodes.setdefault(event.topic, dict())[valueHash] = {
+                'event': event, 'level': 0}
+            frontier.append((event, valueHash, directions))
+        for level in range(1, depth + 1):
+            following: List[tuple[Event, str, List[str]]] = list()
+            for event, valueHash, towards in frontier:
+                for d in towards:
+                    # The "maxFanout" most probable values are among the "maxFanout" most probable of each topic.
+                    if (d == 'causes'):
+                        pr = await self.possibleCausesAsync([event], minTime, maxTime, maxFanout, True)
+                    else:
+                        pr = await self.possibleEffectsAsync([event], minTime, maxTime, maxFanout, True)
+                    selected = sorted([(pr[topic][h], topic, h) for topic in pr for h in pr[topic] if pr[topic][h] >= minProb],
+                                      key=lambda item: item[0], reverse=True)
+                    if (maxFanout is not None):
+                        selected = selected[:maxFanout]
+                    for probability, topic, h in selected:
+                        if (d == 'causes'):
+                            edges.append({'cause': [topic, h], 'effect': [
+                                         event.topic, valueHash], 'probability': probability})
+                        else:
+                            edges.append({'cause': [event.topic, valueHash], 'effect': [
+                                         topic, h], 'probability': probability})
+                        if (h in nodes.get(topic, {})):
+                            continue
+                        value = await self.history.objByHashAsync(h)
+                        if (d == 'causes'):
+                            filled = await self.fillCauseAsync([event], topic, value, minTime, maxTime)
+                        else:
+                            filled = await self.fillEffectAsync([event], topic, value, minTime, maxTime)
+                        nodes.setdefault(topic, dict())[h] = {
+                            'event': filled, 'level': -level if d == 'causes' else level}
+                        following.append((filled, h, [d]))
+            frontier = following
+        return {'nodes': nodes, 'edges': edges}
+
     def causesOf(self, effect: Event, minTime: int = 0, maxTime: int = sys.maxsize) -> List[Event]:
         """
         Wraps the "causesOfAsync" method for synchronous calls
@@ -595,11 +1097,11 @@ class Explainer(ABC):
         """
         return asyncio.run(self.similarEventsAsync(events))
 
-    def possibleCauses(self, effects: List[Event], minTime: int = 0, maxTime: int = sys.maxsize) -> dict[str, dict[str, float]]:
+    def possibleCauses(self, effects: List[Event], minTime: int = 0, maxTime: int = sys.maxsize, topK: int = None, normalize: bool = False) -> dict[str, dict[str, float]]:
         """
         Wraps the "possibleCausesAsync" method for synchronous calls
         """
-        return asyncio.run(self.possibleCausesAsync(effects))
+        return asyncio.run(self.possibleCausesAsync(effects, minTime, maxTime, topK, normalize))
 
     def effectsOf(self, causes: List[Event], minTime: int = 0, maxTime: int = sys.maxsize) -> List[Event]:
         """
@@ -607,11 +1109,11 @@ class Explainer(ABC):
         """
         return asyncio.run(self.effectsOfAsync(causes))
 
-    def possibleEffects(self, causes: List[Event], minTime: int = 0, maxTime: int = sys.maxsize) -> dict[str, dict[Any, float]]:
+    def possibleEffects(self, causes: List[Event], minTime: int = 0, maxTime: int = sys.maxsize, topK: int = None, normalize: bool = False) -> dict[str, dict[Any, float]]:
         """
         Wraps the "possibleEffectsAsync" method for synchronous calls
         """
-        return asyncio.run(self.possibleEffectsAsync(causes))
+        return asyncio.run(self.possibleEffectsAsync(causes, minTime, maxTime, topK, normalize))
 
     def fillEffect(self, causes: List[Event], topic: str, value: Any, minTime: int = 0, maxTime: int = sys.maxsize) -> List[Event]:
         """
@@ -625,6 +1127,12 @@ class Explainer(ABC):
         """
         return asyncio.run(self.fillCauseAsync(effects, topic, value))
 
+    def explainChain(self, events: List[Event], depth: int = 1, direction: str = 'causes', minProb: float = 0.0, maxFanout: int = None, minTime: int = 0, maxTime: int = sys.maxsize) -> dict:
+        """
+        Wraps the "explainChainAsync" method for synchronous calls
+        """
+        return asyncio.run(self.explainChainAsync(events, depth, direction, minProb, maxFanout, minTime, maxTime))
+
 
 class CoreJSONEncoder(json.JSONEncoder):
     def default(self, o):
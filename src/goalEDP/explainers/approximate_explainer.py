@@ -0,0 +1,154 @@
+from ..core import Event, EventBroker, History
+from ..hashing import Hasher
+from .simple_explainer import SimpleExplainer
+from .incremental_explainer import IncrementalExplainer
+from typing import List
+import hashlib
+import math
+import random
+import sys
+
+
+class _CountMinSketch:
+    """
+    Count-min sketch: estimates the count of an item with at most "depth" counters, without storing the items.
+    Estimates never fall below the true counts (as long as the true counts are not negative),
+    and exceed them by at most e / width * (total of the counts) with probability 1 - exp(-depth).
+    """
+
+    def __init__(self, width: int, depth: int):
+        self.width = width
+        self.depth = depth
+        self.rows = [[0] * width for _ in range(depth)]
+        # Sum of all the counts (the L1 norm of the counted items).
+        self.total = 0
+
+    def _indexes(self, item: str) -> List[int]:
+        # Double hashing: the indexes of all the rows come from one digest.
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.width for i in range(self.depth)]
+
+    def add(self, item: str, n: int = 1) -> None:
+        for row, index in zip(self.rows, self._indexes(item)):
+            row[index] += n
+        self.total += n
+
+    def estimate(self, item: str) -> int:
+        return min(row[index] for row, index in zip(self.rows, self._indexes(item)))
+
+
+class _Reservoir:
+    """
+    Uniform sample (reservoir sampling) of the value hashes counted for a pair of topics, used as the candidates of the queries, since a sketch cannot list its items.
+    """
+
+    def __init__(self, size: int, rand: random.Random):
+        self.size = size
+        self.items: List[str] = []
+        self.seen = 0
+        self._random = rand
+
+    def add(self, item: str) -> None:
+        self.seen += 1
+        if (len(self.items) < self.size):
+            self.items.append(item)
+        else:
+            i = self._random.randrange(self.seen)
+            if (i < self.size):
+                self.items[i] = item
+
+
+class ApproximateExplainer(IncrementalExplainer):
+    """
+    Like IncrementalExplainer, but the co-occurrence counts are kept in a count-min sketch and a reservoir sample per pair of topics,
+    so memory does not grow with the number of distinct values. Intended for histories with a very large number of events.
+    "possibleCausesAsync" and "possibleEffectsAsync" estimate the counts of the values in the samples (plus the empty value), so values that are rare in a pair of topics may be missing,
+    and each probability exceeds the exact one by at most the error returned by "possibleCausesWithErrorAsync" and "possibleEffectsWithErrorAsync", with probability 1 - delta.
+    Queries with a time range are answered with the exact methods of SimpleExplainer.
+    """
+
+    def __init__(self, eventBroker: EventBroker, history: History, epsilon: float = 0.001, delta: float = 0.01, sampleSize: int = 256, recentSize: int = 1024, replayHistory: bool = True,
+                 hasher: Hasher = None, concurrency: int = 8):
+        """
+        Constructor:
+        @param epsilon: Error of the counts, relative to the total of the counts of a pair of topics. Each sketch has ceil(e / epsilon) counters per row.
+        @param delta: Probability that a count exceeds the error. Each sketch has ceil(ln(1 / delta)) rows.
+        @param sampleSize: Number of value hashes sampled per pair of topics, as candidates of the queries.
+        @param recentSize: Number of recent events kept per topic to find causes, and of events per pair of topics waiting for an effect.
+        @param replayHistory: If True, the events already saved in the history are counted before the first query.
+        @param hasher: (optional) Hasher of the values, which must give the hashes of "history.hashAsync". Defaults to the hasher of the history.
+        @param concurrency: Maximum number of lookups in the history run concurrently by the queries with a time range.
+        """
+        self.epsilon = epsilon
+        self.delta = delta
+        self.sampleSize = sampleSize
+        self._width = math.ceil(math.e / epsilon)
+        self._depth = math.ceil(math.log(1 / delta))
+        self._random = random.Random(0)
+        # (attr, topic of the key) -> related topic -> (sketch, sample).
+        # Set before the base constructor, which starts receiving events.
+        self._sketches: dict[tuple[str, str], dict[str, tuple[_CountMinSketch, _Reservoir]]] = dict()
+        super().__init__(eventBroker, history, sys.maxsize,
+                         recentSize, replayHistory, hasher=hasher, concurrency=concurrency)
+
+    def _add(self, attr: str, time: int, key: tuple[str, str], topic: str, valueHash: str, n: int = 1) -> None:
+        topics = self._sketches.setdefault((attr, key[0]), dict())
+        if (not topic in topics):
+            topics[topic] = (_CountMinSketch(self._width, self._depth),
+                             _Reservoir(self.sampleSize, self._random))
+        sketch, sample = topics[topic]
+        sketch.add(f'{key[1]}\x00{valueHash}', n)
+        if (n > 0) and (valueHash != self._noneHash):
+            sample.add(valueHash)
+
+    def _estimate(self, attr: str, keys: set[tuple[str, str]], handlers=None) -> tuple[dict[str, dict[str, float]], dict[str, float]]:
+        counts: dict[str, dict[str, int]] = dict()
+        errors: dict[str, float] = dict()
+        for keyTopic, keyHash in keys:
+            for topic, (sketch, sample) in self._sketches.get((attr, keyTopic), {}).items():
+                topicCounts = counts.setdefault(topic, dict())
+                for valueHash in set(sample.items) | set([self._noneHash]):
+                    n = sketch.estimate(f'{keyHash}\x00{valueHash}')
+                    if (n > 0):
+                        topicCounts[valueHash] = topicCounts.get(
+                            valueHash, 0) + n
+                errors[topic] = errors.get(topic, 0) + \
+                    self.epsilon * sketch.total
+        counts = {topic: counts[topic]
+                  for topic in counts if len(counts[topic]) > 0}
+        if (handlers is None):
+            handlers = self.eventBroker.publishers(list(counts))
+        topics = set(topic for h in handlers for topic in h.publishedTopics)
+        total = sum(self._total.outs.get(topic, 0) for topic in topics)
+        probs = {topic: {valueHash: counts[topic][valueHash] / total for valueHash in counts[topic]} for topic in counts}
+        return probs, {topic: errors[topic] / total for topic in counts}
+
+    async def possibleCausesWithErrorAsync(self, effects: List[Event]) -> tuple[dict[str, dict[str, float]], dict[str, float]]:
+        """
+        @return: The probabilities of possible causes (as in "possibleCausesAsync") and, for each topic, the maximum error of its probabilities (with probability 1 - delta).
+        """
+        await self.updateAsync()
+        keys = await self._keys(effects)
+        with self._lock:
+            return self._estimate('causes', keys, self.pubHandlers(effects))
+
+    async def possibleEffectsWithErrorAsync(self, causes: List[Event]) -> tuple[dict[str, dict[str, float]], dict[str, float]]:
+        """
+        @return: The probabilities of possible effects (as in "possibleEffectsAsync") and, for each topic, the maximum error of its probabilities (with probability 1 - delta).
+        """
+        await self.updateAsync()
+        keys = await self._keys(causes)
+        with self._lock:
+            return self._estimate('effects', keys)
+
+    async def possibleCausesAsync(self, effects: List[Event], minTime: int = 0, maxTime: int = sys.maxsize, topK: int = None, normalize: bool = False) -> dict[str, dict[str, float]]:
+        if (minTime > 0) or (maxTime < sys.maxsize):
+            return await SimpleExplainer.possibleCausesAsync(self, effects, minTime, maxTime, topK, normalize)
+        return self.topKProbs((await self.possibleCausesWithErrorAsync(effects))[0], topK, normalize)
+
+    async def possibleEffectsAsync(self, causes: List[Event], minTime: int = 0, maxTime: int = sys.maxsize, topK: int = None, normalize: bool = False) -> dict[str, dict[str, float]]:
+        if (minTime > 0) or (maxTime < sys.maxsize):
+            return await SimpleExplainer.possibleEffectsAsync(self, causes, minTime, maxTime, topK, normalize)
+        return self.topKProbs((await self.possibleEffectsWithErrorAsync(causes))[0], topK, normalize)
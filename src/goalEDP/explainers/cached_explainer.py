@@ -0,0 +1,165 @@
+from ..core import Explainer, Event, EventHandler
+from typing import Any, List
+from collections import OrderedDict
+import sys
+import threading
+
+
+class _Entry:
+    """
+    A cached result, with the topics and time range it depends on.
+    """
+
+    def __init__(self, topics: set[str], minTime: int, maxTime: int):
+        self.topics = topics
+        self.minTime = minTime
+        self.maxTime = maxTime
+        self.value = None
+        # Set when an event that affects the result arrives while it is being computed.
+        self.stale = False
+
+    def affectedBy(self, event: Event) -> bool:
+        return (event.topic in self.topics) and (event.initTime >= self.minTime) and (event.time <= self.maxTime)
+
+
+class CachedExplainer(Explainer):
+    """
+    Wraps any Explainer to cache the results of "causesOfAsync", "effectsOfAsync", "possibleCausesAsync" and "possibleEffectsAsync",
+    for example, while the user of the WebGUI expands explanation levels.
+    Results are kept in an LRU cache, keyed by the method, the input events (ids and times, or topics and value hashes for the probabilities) and the time range.
+    A result is invalidated only when an event published in the broker (see "EventBroker.addListener") is in its time range and in a topic it depends on
+    (the topics of the inputs and of the handlers that publish or subscribe them). So results with "maxTime" in the past are never invalidated.
+    Returned results are copies, so callers can change them (as "normalizeProbs" does).
+    """
+
+    def __init__(self, explainer: Explainer, maxSize: int = 1024):
+        """
+        Constructor:
+        @param explainer: Explainer whose results are cached.
+        @param maxSize: Maximum number of cached results.
+        """
+        super().__init__(explainer.eventBroker, explainer.history, explainer.concurrency)
+        self.explainer = explainer
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple, _Entry] = OrderedDict()
+        # Topic -> keys of the entries that depend on it.
+        self._byTopic: dict[str, set[tuple]] = dict()
+        self._computing: set[_Entry] = set()
+        self._lock = threading.Lock()
+        self.eventBroker.addListener(self._invalidate)
+
+    def _invalidate(self, event: Event) -> None:
+        with self._lock:
+            for key in list(self._byTopic.get(event.topic, [])):
+                if (self._entries[key].affectedBy(event)):
+                    self._remove(key)
+            for entry in self._computing:
+                if (entry.affectedBy(event)):
+                    entry.stale = True
+
+    def _remove(self, key: tuple) -> None:
+        entry = self._entries.pop(key)
+        for topic in entry.topics:
+            keys = self._byTopic[topic]
+            keys.discard(key)
+            if (len(keys) == 0):
+                del self._byTopic[topic]
+
+    def clear(self) -> None:
+        """
+        Discards all the cached results.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._byTopic.clear()
+            for entry in self._computing:
+                entry.stale = True
+
+    def _relevantTopics(self, topics: set[str]) -> set[str]:
+        """
+        Topics whose events can change a result about events of the given topics: the topics themselves, the topics of the handlers that publish or subscribe them,
+        and the topics published by the publishers of these (used to count outputs).
+        """
+        relevant = set(topics)
+        for handler in self.eventBroker.publishers(list(topics)) + self.eventBroker.subscribers(list(topics)):
+            relevant.update(handler.subscribedTopics)
+            relevant.update(handler.publishedTopics)
+        for handler in self.eventBroker.publishers(list(relevant)):
+            relevant.update(handler.publishedTopics)
+        return relevant
+
+    async def _cachedAsync(self, key: tuple, events: List[Event], minTime: int, maxTime: int, compute, result=None) -> Any:
+        """
+        @param result: (optional) Builds the returned result from the cached value, without changing it. Default: a copy.
+        """
+        if (result is None):
+            result = self._copy
+        with self._lock:
+            if (key in self._entries):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return result(self._entries[key].value)
+            self.misses += 1
+            entry = _Entry(self._relevantTopics(
+                set(e.topic for e in events)), minTime, maxTime)
+            self._computing.add(entry)
+        try:
+            entry.value = await compute()
+        finally:
+            with self._lock:
+                self._computing.discard(entry)
+        with self._lock:
+            if (not entry.stale):
+                if (key in self._entries):
+                    self._remove(key)
+                self._entries[key] = entry
+                for topic in entry.topics:
+                    self._byTopic.setdefault(topic, set()).add(key)
+                while (len(self._entries) > self.maxSize):
+                    self._remove(next(iter(self._entries)))
+        return result(entry.value)
+
+    def _copy(self, value: Any) -> Any:
+        if (isinstance(value, dict)):
+            return {topic: dict(value[topic]) for topic in value}
+        return list(value)
+
+    def _eventsKey(self, events: List[Event]) -> tuple:
+        return tuple(sorted((e.id, e.topic, e.time, e.initTime) for e in events))
+
+    async def _valuesKey(self, events: List[Event]) -> tuple:
+        return tuple(sorted(set([(e.topic, await self.history.hashAsync(e.value)) for e in events])))
+
+    async def causesOfAsync(self, effects: List[Event], minTime: int = 0, maxTime: int = sys.maxsize) -> List[Event]:
+        return await self._cachedAsync(('causesOf', self._eventsKey(effects), minTime, maxTime), effects, minTime, maxTime,
+                                       lambda: self.explainer.causesOfAsync(effects, minTime, maxTime))
+
+    async def effectsOfAsync(self, causes: List[Event], minTime: int = 0, maxTime: int = sys.maxsize) -> List[Event]:
+        return await self._cachedAsync(('effectsOf', self._eventsKey(causes), minTime, maxTime), causes, minTime, maxTime,
+                                       lambda: self.explainer.effectsOfAsync(causes, minTime, maxTime))
+
+    def _probsResult(self, topK: int, normalize: bool):
+        # "topKProbs" builds a new dict (from the cached one) when it selects or normalizes, so the whole distribution is copied only when it is returned.
+        if (topK is None) and (not normalize):
+            return self._copy
+        return lambda pr: self.topKProbs(pr, topK, normalize)
+
+    async def possibleCausesAsync(self, effects: List[Event], minTime: int = 0, maxTime: int = sys.maxsize, topK: int = None, normalize: bool = False) -> dict[str, dict[str, float]]:
+        # The whole distribution is cached, so that queries with any "topK" share it.
+        return await self._cachedAsync(('possibleCauses', await self._valuesKey(effects), minTime, maxTime), effects, minTime, maxTime,
+                                       lambda: self.explainer.possibleCausesAsync(effects, minTime, maxTime), self._probsResult(topK, normalize))
+
+    async def possibleEffectsAsync(self, causes: List[Event], minTime: int = 0, maxTime: int = sys.maxsize, topK: int = None, normalize: bool = False) -> dict[str, dict[str, float]]:
+        return await self._cachedAsync(('possibleEffects', await self._valuesKey(causes), minTime, maxTime), causes, minTime, maxTime,
+                                       lambda: self.explainer.possibleEffectsAsync(causes, minTime, maxTime), self._probsResult(topK, normalize))
+
+    async def similarEventsAsync(self, events: List[Event], minTime: int = 0, maxTime: int = sys.maxsize) -> tuple[List[Event], List[EventHandler]]:
+        return await self.explainer.similarEventsAsync(events, minTime, maxTime)
+
+    async def fillEffectAsync(self, causes: List[Event], topic: str, value: Any, minTime: int = 0, maxTime: int = sys.maxsize) -> Event:
+        return await self.explainer.fillEffectAsync(causes, topic, value, minTime, maxTime)
+
+    async def fillCauseAsync(self, effects: List[Event], topic: str, value: Any, minTime: int = 0, maxTime: int = sys.maxsize) -> Event:
+        return await self.explainer.fillCauseAsync(effects, topic, value, minTime, maxTime)
@@ -0,0 +1,340 @@
+from ..core import Event, EventBroker, History, EventHandler
+from ..hashing import Hasher, JSONHasher
+from .simple_explainer import SimpleExplainer
+from typing import List
+from collections import Counter, deque
+import asyncio
+import bisect
+import heapq
+import math
+import sys
+import threading
+
+
+class _Seen:
+    """
+    An event already processed, kept while it can still be selected as the cause of a new event.
+    """
+
+    def __init__(self, event: Event, valueHash: str):
+        self.event = event
+        self.valueHash = valueHash
+        # Keys (topic, value hash) of the effects for which this event was already counted as a cause, so that it is counted once per key.
+        self.causeOf: set[tuple[str, str]] = set()
+        # Keys (topic, value hash) of the causes for which this event is the effect: key -> [number of causes, time of the bucket where it was counted].
+        self.effectOf: dict[tuple[str, str], list[int]] = dict()
+
+
+class _Waiting:
+    """
+    A recent event, with its current effect on a topic (the one with the smallest initTime >= its time seen so far).
+    """
+
+    def __init__(self, seen: _Seen, handlers: int):
+        self.seen = seen
+        # Number of handlers that relate the topic of the event to the topic of the effect.
+        self.handlers = handlers
+        self.effect: _Seen | None = None
+
+
+class _Counts:
+    """
+    Co-occurrence and output counts, for all the time or for a time bucket.
+    """
+
+    def __init__(self):
+        # (effect topic, effect value hash) -> cause topic -> cause value hash -> count.
+        self.causes: dict[tuple[str, str], dict[str, dict[str, int]]] = dict()
+        # (cause topic, cause value hash) -> effect topic -> effect value hash -> count.
+        self.effects: dict[tuple[str, str], dict[str, dict[str, int]]] = dict()
+        # Topic -> number of events.
+        self.outs: dict[str, int] = dict()
+
+    @staticmethod
+    def add(counts: dict[tuple[str, str], dict[str, dict[str, int]]], key: tuple[str, str], topic: str, valueHash: str, n: int) -> None:
+        topics = counts.setdefault(key, dict())
+        hashes = topics.setdefault(topic, dict())
+        hashes[valueHash] = hashes.get(valueHash, 0) + n
+        # Empty entries are removed, since the topics of the effects decide the publishers used to normalize.
+        if (hashes[valueHash] == 0):
+            del hashes[valueHash]
+            if (len(hashes) == 0):
+                del topics[topic]
+
+
+class IncrementalExplainer(SimpleExplainer):
+    """
+    Keeps the statistics used by "possibleCausesAsync" and "possibleEffectsAsync" up to date as events are published in the broker (see "EventBroker.addListener"),
+    so that these queries are dictionary lookups instead of scans of the history. The other methods are the ones of SimpleExplainer.
+    For each event, its cause on each topic subscribed by the publishers of its topic is the latest recent event with time <= its initTime (as in SimpleExplainer),
+    and its effect on each topic published by the subscribers of its topic is the recent event with the smallest initTime >= its time (revised as new events arrive).
+    Counts are kept for all the time and per time bucket. Queries with a time range add the buckets that overlap the range, so they are approximate at the bucket granularity.
+    To follow a system whose behavior drifts, queries without a time range can weight recent events more ("halfLifeNs", an exponential decay by the time of the events),
+    or consider only the buckets of the last "windowNs" nanoseconds (a sliding window that ends at the latest event). Both are maintained as events arrive.
+    Events are processed as they are received in the threads of the broker, hashing their values with the hasher of the History.
+    If "replayHistory" is True, the events of the history are counted at the first query (or call to "updateAsync"). Until then, received events are not kept,
+    as the broker saves them in the history before notifying them; only the ones received during the replay are kept, and counted after it.
+    Queries from different threads are serialized.
+    """
+
+    def __init__(self, eventBroker: EventBroker, history: History, bucketNs: int = 60000000000, recentSize: int = 1024, replayHistory: bool = True,
+                 halfLifeNs: int = None, windowNs: int = None, hasher: Hasher = None, concurrency: int = 8):
+        """
+        Constructor:
+        @param bucketNs: Size (in nanoseconds) of the time buckets used by queries with a time range.
+        @param recentSize: Number of recent events kept per topic to find causes, and of events per pair of topics waiting for an effect.
+        @param replayHistory: If True, the events already saved in the history are counted before the first query.
+        @param halfLifeNs: (optional) Half-life (in nanoseconds) of the weight of events in queries without a time range.
+        @param windowNs: (optional) Length (in nanoseconds) of the sliding window of queries without a time range. It is rounded to the buckets.
+        @param hasher: (optional) Hasher of the values, which must give the hashes of "history.hashAsync". Defaults to the hasher of the history.
+        @param concurrency: Maximum number of lookups in the history run concurrently by the queries of SimpleExplainer.
+        """
+        super().__init__(eventBroker, history, concurrency)
+        if (halfLifeNs is not None) and (windowNs is not None):
+            raise Exception('Use either halfLifeNs or windowNs, not both.')
+        self.halfLifeNs = halfLifeNs
+        self.windowNs = windowNs
+        self.bucketNs = bucketNs
+        self.recentSize = recentSize
+        if (hasher is None):
+            hasher = getattr(history, 'hasher', None) or JSONHasher()
+        self.hasher = hasher
+        # "pending" until the first query starts the replay of the history, "replaying" while it runs, then "done".
+        self._replay = 'pending' if replayHistory else 'done'
+        # Events received during the replay.
+        self._incoming: deque[Event] = deque()
+        # Never held across an await, so queries of the same event loop cannot interleave inside it.
+        self._lock = threading.Lock()
+        self._total = _Counts()
+        self._buckets: dict[int, _Counts] = dict()
+        self._starts: list[int] = []
+        self._recent: dict[str, deque[_Seen]] = dict()
+        # (cause topic, effect topic) -> recent events of the cause topic, with their current effects.
+        self._pending: dict[tuple[str, str], deque[_Waiting]] = dict()
+        self._noneHash = hasher.hash(None)
+        # Time of the latest event, where the sliding window ends.
+        self._latest = 0
+        # Decayed counts, weighted by exp(rate * (time - landmark)) (forward decay), so that old counts never need to be updated.
+        # The weights are relative to the landmark, which moves (rescaling the counts) before they overflow.
+        self._decayed = _Counts()
+        self._landmark = None
+        eventBroker.addListener(self._receive)
+
+    def _receive(self, event: Event) -> None:
+        valueHash = self.hasher.hash(event.value)
+        with self._lock:
+            if (self._replay == 'pending'):
+                # Already saved in the history, so the replay counts it.
+                return
+            if (self._replay == 'replaying'):
+                self._incoming.append(event)
+                return
+            self._process(event, valueHash)
+
+    def _bucket(self, time: int) -> _Counts:
+        start = (time // self.bucketNs) * self.bucketNs
+        if (not start in self._buckets):
+            bisect.insort(self._starts, start)
+            self._buckets[start] = _Counts()
+        return self._buckets[start]
+
+    def _weight(self, time: int) -> float:
+        rate = math.log(2) / self.halfLifeNs
+        if (self._landmark is None):
+            self._landmark = time
+        elif (rate * (time - self._landmark) > 500):
+            factor = math.exp(-rate * (time - self._landmark))
+            for counts in (self._decayed.causes, self._decayed.effects):
+                for topics in counts.values():
+                    for hashes in topics.values():
+                        for valueHash in hashes:
+                            hashes[valueHash] *= factor
+            for topic in self._decayed.outs:
+                self._decayed.outs[topic] *= factor
+            self._landmark = time
+        return math.exp(rate * (time - self._landmark))
+
+    def _add(self, attr: str, time: int, key: tuple[str, str], topic: str, valueHash: str, n: int = 1) -> None:
+        for counts in (self._total, self._bucket(time)):
+            _Counts.add(getattr(counts, attr), key, topic, valueHash, n)
+        if (self.halfLifeNs is not None):
+            # Removals use the time of the addition, so they cancel it. The rounding residue is discarded.
+            # The weight goes first, since moving the landmark rescales the counts.
+            weight = self._weight(time)
+            previous = getattr(self._decayed, attr).get(
+                key, {}).get(topic, {}).get(valueHash, 0)
+            weighted = previous + n * weight
+            if (abs(weighted) <= 1e-9 * abs(previous)):
+                weighted = 0
+            _Counts.add(getattr(self._decayed, attr), key,
+                        topic, valueHash, weighted - previous)
+
+    def _addOut(self, time: int, topic: str) -> None:
+        for counts in (self._total, self._bucket(time)):
+            counts.outs[topic] = counts.outs.get(topic, 0) + 1
+        if (self.halfLifeNs is not None):
+            weight = self._weight(time)
+            self._decayed.outs[topic] = self._decayed.outs.get(
+                topic, 0) + weight
+        self._latest = max(self._latest, time)
+
+    def _predecessor(self, topic: str, time: int) -> _Seen | None:
+        """
+        The first of the recent events of the topic with the largest time <= the given time (and > 0).
+        Events of a topic arrive in time order, so the search goes backwards and stops at the first event before the time (and the ones with the same time).
+        """
+        best = None
+        for seen in reversed(self._recent.get(topic, [])):
+            if (best is not None):
+                if (seen.event.time != best.event.time):
+                    break
+                best = seen
+            elif (seen.event.time <= time):
+                if (seen.event.time <= 0):
+                    break
+                best = seen
+        return best
+
+    def _ref(self, effect: _Seen, key: tuple[str, str], time: int) -> None:
+        if (not key in effect.effectOf):
+            effect.effectOf[key] = [0, time]
+            self._add('effects', time, key, effect.event.topic,
+                      effect.valueHash)
+        effect.effectOf[key][0] += 1
+
+    def _unref(self, effect: _Seen, key: tuple[str, str]) -> None:
+        ref = effect.effectOf[key]
+        ref[0] -= 1
+        if (ref[0] == 0):
+            del effect.effectOf[key]
+            self._add('effects', ref[1], key, effect.event.topic,
+                      effect.valueHash, -1)
+
+    def _process(self, event: Event, valueHash: str) -> None:
+        seen = _Seen(event, valueHash)
+        key = (event.topic, valueHash)
+        self._addOut(event.time, event.topic)
+        # As an effect: its causes on the topics subscribed by the publishers of its topic.
+        causeTopics = Counter(topic for handler in self.eventBroker.publishers(
+            [event.topic]) for topic in handler.subscribedTopics)
+        for topic, n in causeTopics.items():
+            cause = self._predecessor(topic, event.initTime)
+            if (cause is None):
+                self._add('causes', event.time, key, topic, self._noneHash, n)
+            elif (not key in cause.causeOf):
+                cause.causeOf.add(key)
+                self._add('causes', event.time, key,
+                          topic, cause.valueHash)
+            # As the effect of the recent events of the topic, when it started before their current effects.
+            # The effects of older events started earlier (they had more candidates), so the search stops at the first event whose effect started before this one.
+            for waiting in reversed(self._pending.get((topic, event.topic), [])):
+                if (waiting.seen.event.time > event.initTime):
+                    continue
+                if (waiting.effect is not None) and (waiting.effect.event.initTime <= event.initTime):
+                    break
+                waitingKey = (topic, waiting.seen.valueHash)
+                if (waiting.effect is None):
+                    self._add('effects', waiting.seen.event.time, waitingKey,
+                              event.topic, self._noneHash, -waiting.handlers)
+                else:
+                    self._unref(waiting.effect, waitingKey)
+                waiting.effect = seen
+                self._ref(seen, waitingKey, waiting.seen.event.time)
+        # As a cause: it waits for an effect on the topics published by the subscribers of its topic. Meanwhile, it counts as an empty effect.
+        effectTopics = Counter(topic for handler in self.eventBroker.subscribers(
+            [event.topic]) for topic in handler.publishedTopics)
+        for topic, n in effectTopics.items():
+            self._pending.setdefault((event.topic, topic), deque(
+                maxlen=self.recentSize)).append(_Waiting(seen, n))
+            self._add('effects', event.time, key, topic, self._noneHash, n)
+        self._recent.setdefault(event.topic, deque(
+            maxlen=self.recentSize)).append(seen)
+
+    async def updateAsync(self) -> None:
+        """
+        On the first call, counts the events of the history and then the events received meanwhile. Later calls return at once.
+        If the replay fails, the events received meanwhile are still counted, and it is not retried.
+        """
+        with self._lock:
+            if (self._replay == 'done'):
+                return
+            replaying = self._replay == 'replaying'
+            self._replay = 'replaying'
+        if (replaying):
+            # Another query (of this event loop or of another thread) is replaying the history.
+            while (self._replay != 'done'):
+                await asyncio.sleep(0.001)
+            return
+        replayed: set[str] = set()
+        try:
+            async for event in self.history.iterEventsAsync({}):
+                valueHash = self.hasher.hash(event.value)
+                with self._lock:
+                    replayed.add(event.id)
+                    self._process(event, valueHash)
+        finally:
+            # The events already replayed stay counted, so a failed replay is not retried.
+            with self._lock:
+                # Events published during the replay may also be in the history.
+                while (len(self._incoming) > 0):
+                    event = self._incoming.popleft()
+                    if (not event.id in replayed):
+                        self._process(event, self.hasher.hash(event.value))
+                self._replay = 'done'
+
+    def _counts(self, minTime: int, maxTime: int) -> List[_Counts]:
+        if (minTime <= 0) and (maxTime >= sys.maxsize):
+            if (self.halfLifeNs is not None):
+                return [self._decayed]
+            if (self.windowNs is not None):
+                return self._counts(max(self._latest - self.windowNs, 1), maxTime)
+            return [self._total]
+        first = bisect.bisect_left(
+            self._starts, (minTime // self.bucketNs) * self.bucketNs)
+        last = bisect.bisect_right(self._starts, maxTime)
+        return [self._buckets[start] for start in self._starts[first:last]]
+
+    def _probs(self, attr: str, keys: set[tuple[str, str]], countsList: List[_Counts], handlers: List[EventHandler] = None, topK: int = None, normalize: bool = False) -> dict[str, dict[str, float]]:
+        if (len(countsList) == 1) and (len(keys) == 1):
+            # A single key without a time range: the maintained counts are used as they are, without merging them.
+            counts: dict[str, dict[str, int]] = getattr(countsList[0], attr).get(next(iter(keys)), {})
+        else:
+            counts = dict()
+            for c in countsList:
+                for key in keys:
+                    for topic, hashes in getattr(c, attr).get(key, {}).items():
+                        topicCounts = counts.setdefault(topic, dict())
+                        for valueHash, n in hashes.items():
+                            topicCounts[valueHash] = topicCounts.get(
+                                valueHash, 0) + n
+        counts = {topic: counts[topic] for topic in counts if any(n > 0 for n in counts[topic].values())}
+        if (normalize):
+            total = sum(n for topic in counts for n in counts[topic].values() if n > 0)
+        else:
+            if (handlers is None):
+                handlers = self.eventBroker.publishers(list(counts))
+            topics = set(topic for h in handlers for topic in h.publishedTopics)
+            total = sum(c.outs.get(topic, 0) for c in countsList for topic in topics)
+        res: dict[str, dict[str, float]] = dict()
+        for topic in counts:
+            positive = ((valueHash, n) for valueHash, n in counts[topic].items() if n > 0)
+            if (topK is not None):
+                # Only the kept counts are divided by the total (ties as in "topKProbs").
+                positive = heapq.nsmallest(topK, positive, key=lambda item: (-item[1], item[0]))
+            res[topic] = {valueHash: n / total for valueHash, n in positive}
+        return res
+
+    async def _keys(self, events: List[Event]) -> set[tuple[str, str]]:
+        return set([(e.topic, await self.history.hashAsync(e.value)) for e in events])
+
+    async def possibleCausesAsync(self, effects: List[Event], minTime: int = 0, maxTime: int = sys.maxsize, topK: int = None, normalize: bool = False) -> dict[str, dict[str, float]]:
+        await self.updateAsync()
+        keys = await self._keys(effects)
+        with self._lock:
+            return self._probs('causes', keys, self._counts(minTime, maxTime), self.pubHandlers(effects), topK, normalize)
+
+    async def possibleEffectsAsync(self, causes: List[Event], minTime: int = 0, maxTime: int = sys.maxsize, topK: int = None, normalize: bool = False) -> dict[str, dict[str, float]]:
+        await self.updateAsync()
+        keys = await self._keys(causes)
+        with self._lock:
+            return self._probs('effects', keys, self._counts(minTime, maxTime), topK=topK, normalize=normalize)
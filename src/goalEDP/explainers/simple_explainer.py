@@ -7,25 +7,33 @@ import sys
 class SimpleExplainer(Explainer):
     """
     A non-optimized explainer, for academic purposes. It serves as a reference to implement the explanation generating methods.
+    The history of each topic needed by a query is recovered once, and independent lookups run concurrently (see "concurrency").
+    Events are deduplicated by id, since some Histories return a new Event object on each read.
     """
 
-    def __init__(self, eventBroker: EventBroker, history: History):
-        super().__init__(eventBroker, history)
+    def __init__(self, eventBroker: EventBroker, history: History, concurrency: int = 8):
+        super().__init__(eventBroker, history, concurrency)
+
+    async def _topicsHistAsync(self, topics: set[str], minTime: int, maxTime: int) -> dict[str, List[Event]]:
+        return await self._gatherAsync({topic: lambda topic=topic: self.history.getEventsAsync({'topics': [topic], 'minTime': minTime, 'maxTime': maxTime})
+                                        for topic in topics})
 
     async def causesOfAsync(self, effects: List[Event], minTime: int = 0, maxTime: int = sys.maxsize) -> List[Event]:
-        causes: set[Event] = set()
+        causes: dict[str, Event] = dict()
+        histByTopic = await self._topicsHistAsync(set(topic for effect in effects for eventHandler in self.eventBroker.publishers([effect.topic])
+                                                      for topic in eventHandler.subscribedTopics), minTime, maxTime)
         for effect in effects:
             for eventHandler in self.eventBroker.publishers([effect.topic]):
                 for topic in eventHandler.subscribedTopics:
-                    hist: List[Event] = await self.history.getEventsAsync({'topics': [topic], 'minTime': minTime, 'maxTime': maxTime})
+                    hist: List[Event] = histByTopic[topic]
                     cause = Event(topic=topic, value=None,
                                   time=0, initTime=0)
                     for e in hist:
                         if (e.time <= effect.initTime):
                             if (e.time > cause.time):
                                 cause = e
-                    causes.add(cause)
-        return list(causes)
+                    causes[cause.id] = cause
+        return list(causes.values())
 
     def _includeVal(self, val: Any, valuesList: List[Any]):
         for item in valuesList:
@@ -47,13 +55,18 @@ class SimpleExplainer(Explainer):
         return self.eventBroker.publishers(list(topics))
 
     async def similarEventsAsync(self, events: List[Event], minTime: int = 0, maxTime: int = sys.maxsize) -> tuple[List[Event], List[EventHandler]]:
-        similarEvents = set()
-        for e in events:
-            valHash = await self.history.hashAsync(e.value)
-            similarEvents.update(await self.history.getEventsAsync({'topics': [e.topic], 'valuesHashes': [valHash], 'minTime': minTime, 'maxTime': maxTime}))
-        return similarEvents
-
-    async def possibleCausesAsync(self, effects: List[Event], minTime: int = 0, maxTime: int = sys.maxsize) -> dict[str, dict[str, float]]:
+        similarEvents: dict[str, Event] = dict()
+        valHashes = await self._gatherAsync({n: lambda e=e: self.history.hashAsync(e.value) for n, e in enumerate(events)})
+        lookups = dict()
+        for n, e in enumerate(events):
+            lookups[(e.topic, valHashes[n])] = lambda topic=e.topic, valHash=valHashes[n]: self.history.getEventsAsync(
+                {'topics': [topic], 'valuesHashes': [valHash], 'minTime': minTime, 'maxTime': maxTime})
+        for similars in (await self._gatherAsync(lookups)).values():
+            for e in similars:
+                similarEvents[e.id] = e
+        return list(similarEvents.values())
+
+    async def possibleCausesAsync(self, effects: List[Event], minTime: int = 0, maxTime: int = sys.maxsize, topK: int = None, normalize: bool = False) -> dict[str, dict[str, float]]:
         counts: dict[str, dict[str, int]] = dict()
         probs: dict[str, dict[str, float]] = dict()
         sEffects = await self.similarEventsAsync(effects, minTime, maxTime)
@@ -72,14 +85,16 @@ class SimpleExplainer(Explainer):
             for valHash in counts[topic]:
                 probs[topic][valHash] = counts[topic][valHash] / \
                     allOutHandlersEventsCount
-        return probs
+        return self.topKProbs(probs, topK, normalize)
 
     async def effectsOfAsync(self, causes: List[Event], minTime: int = 0, maxTime: int = sys.maxsize) -> List[Event]:
-        effects: set[Event] = set()
+        effects: dict[str, Event] = dict()
+        histByTopic = await self._topicsHistAsync(set(topic for cause in causes for subscriber in self.eventBroker.subscribers([cause.topic])
+                                                      for topic in subscriber.publishedTopics), minTime, maxTime)
         for cause in causes:
             for subscriber in self.eventBroker.subscribers([cause.topic]):
                 for topic in subscriber.publishedTopics:
-                    events: List[Event] = await self.history.getEventsAsync({'topics': [topic], 'minTime': minTime, 'maxTime': maxTime})
+                    events: List[Event] = histByTopic[topic]
 
                     effect = Event(topic=topic, value=None,
                                    time=0, initTime=sys.maxsize)
@@ -87,10 +102,10 @@ class SimpleExplainer(Explainer):
                         if (e.initTime >= cause.time):
                             if (e.initTime < effect.initTime):
                                 effect = e
-                    effects.add(effect)
-        return list(effects)
+                    effects[effect.id] = effect
+        return list(effects.values())
 
-    async def possibleEffectsAsync(self, causes: List[Event], minTime: int = 0, maxTime: int = sys.maxsize) -> dict[str, dict[str, float]]:
+    async def possibleEffectsAsync(self, causes: List[Event], minTime: int = 0, maxTime: int = sys.maxsize, topK: int = None, normalize: bool = False) -> dict[str, dict[str, float]]:
         probs: dict[str, dict[Any, float]] = dict()
         counts: dict[str, dict[str, int]] = dict()
         similarCauses = await self.similarEventsAsync(causes, minTime, maxTime)
@@ -110,7 +125,7 @@ class SimpleExplainer(Explainer):
             for valHash in counts[topic]:
                 probs[topic][valHash] = counts[topic][valHash] / \
                     allOutHandlersEventsCount
-        return probs
+        return self.topKProbs(probs, topK, normalize)
 
     def _lastByTime(self, hist: List[Event]) -> Event:
         last = hist[0]
@@ -126,28 +141,12 @@ class SimpleExplainer(Explainer):
                 first = h
         return first
 
-    def _avgDiff(self, times1: List[float], times2: List[float]) -> float:
-        sum = 0
-        maxLen = len(times1)
-        if(maxLen == 0):
-            return 0
-        if (len(times2) < len(times1)):
-            maxLen = len(times2)
-        for index in range(maxLen):
-            sum += abs(times1[index] - times2[index])
-        return sum/maxLen
-
-    async def _times(self, topic: str, minTime: int = 0, maxTime: int = sys.maxsize) -> List[float]:
-        events: List[Event] = await self.history.getEventsAsync({'topics': [topic], 'minTime': minTime, 'maxTime': maxTime})
-        return [e.time for e in events]
-
-    async def _initTimes(self, topic: str, minTime: int = 0, maxTime: int = sys.maxsize) -> List[float]:
-        events: List[Event] = await self.history.getEventsAsync({'topics': [topic], 'minTime': minTime, 'maxTime': maxTime})
-        return [e.initTime for e in events]
+    async def _processingTimeAvg(self, topic: str, minTime: int = 0, maxTime: int = sys.maxsize) -> float:
+        return (await self.history.processingStatsAsync(topic, minTime, maxTime))['mean']
 
     async def fillEffectAsync(self, causes: List[Event], topic: str, value: Any, minTime: int = 0, maxTime: int = sys.maxsize) -> Event:
         initTime = self._lastByTime(causes).time
-        processingTimeAvg = self._avgDiff(await self._times(topic, minTime, maxTime), await self._initTimes(topic, minTime, maxTime))
+        processingTimeAvg = await self._processingTimeAvg(topic, minTime, maxTime)
         time = initTime + processingTimeAvg
         effect = Event(topic=topic, value=value,
                        initTime=initTime, time=time)
@@ -155,7 +154,7 @@ class SimpleExplainer(Explainer):
 
     async def fillCauseAsync(self, effects: List[Event], topic: str, value: Any, minTime: int = 0, maxTime: int = sys.maxsize) -> Event:
         time = self._firstByTime(effects).time
-        processingTimeAvg = self._avgDiff(await self._times(topic, minTime, maxTime), await self._initTimes(topic, minTime, maxTime))
+        processingTimeAvg = await self._processingTimeAvg(topic, minTime, maxTime)
         initTime = time - processingTimeAvg
         cause = Event(topic=topic, value=value,
                       initTime=initTime, time=time)
@@ -0,0 +1,125 @@
+from ..core import Event, EventBroker, History
+from .indexed_explainer import IndexedExplainer
+from typing import List
+import numpy as np
+import sys
+
+
+class _TopicArrays:
+    """
+    Events of a topic recovered once for a query, sorted (stably) by a time attribute, with the sorted times in a NumPy array.
+    When the History provides columns (see "ColumnarHistory.getColumnsAsync"), the value hashes of the events are kept instead of the events.
+    """
+
+    def __init__(self, events: List[Event], attr: str, columns: dict[str, np.ndarray] = None):
+        if (columns is None):
+            self.events = sorted(events, key=lambda e: getattr(e, attr))
+            self.keys = np.array([getattr(e, attr)
+                                 for e in self.events], dtype=np.int64)
+            self.valueHashes = None
+        else:
+            order = np.argsort(columns[attr], kind='stable')
+            self.events = None
+            self.keys = columns[attr][order]
+            self.valueHashes = columns['hash'][order]
+
+
+class VectorizedExplainer(IndexedExplainer):
+    """
+    Returns the same results as SimpleExplainer. "possibleCausesAsync" and "possibleEffectsAsync" do all the predecessor (or successor) searches of a query in batch:
+    the times of the similar events of each topic are searched ("numpy.searchsorted") in the sorted times of each related topic,
+    the selected events are deduplicated with "numpy.unique", and only their values are hashed.
+    With a ColumnarHistory, the times and value hashes of the related topics are recovered as columns, without building Event instances or hashing values.
+    Requires the optional dependency "numpy".
+    """
+
+    def __init__(self, eventBroker: EventBroker, history: History, concurrency: int = 8):
+        super().__init__(eventBroker, history, concurrency)
+
+    async def _topicArrays(self, arrays: dict[str, _TopicArrays], topic: str, attr: str, minTime: int, maxTime: int) -> _TopicArrays:
+        if (not topic in arrays):
+            filters = {'topics': [topic], 'minTime': minTime, 'maxTime': maxTime}
+            if (hasattr(self.history, 'getColumnsAsync')):
+                arrays[topic] = _TopicArrays(None, attr, await self.history.getColumnsAsync(filters, [attr, 'hash']))
+            else:
+                arrays[topic] = _TopicArrays(await self.history.getEventsAsync(filters), attr)
+        return arrays[topic]
+
+    def _byTopic(self, events: List[Event], attr: str) -> dict[str, np.ndarray]:
+        times: dict[str, list[int]] = dict()
+        for e in events:
+            times.setdefault(e.topic, []).append(getattr(e, attr))
+        return {topic: np.array(times[topic], dtype=np.int64) for topic in times}
+
+    async def _countValues(self, selected: dict[str, list[np.ndarray]], empty: dict[str, int], arrays: dict[str, _TopicArrays]) -> dict[str, dict[str, int]]:
+        """
+        Counts the values of the selected events (positions in the arrays of each topic, deduplicated), plus the empty events (value None) of each topic.
+        """
+        counts: dict[str, dict[str, int]] = dict()
+        for topic in selected:
+            positions = np.unique(np.concatenate(selected[topic]))
+            if (len(positions) == 0) and (empty[topic] == 0):
+                continue
+            topicCounts = counts.setdefault(topic, dict())
+            events = arrays[topic].events
+            valueHashes = arrays[topic].valueHashes
+            for position in positions.tolist():
+                if (valueHashes is not None):
+                    valHash = valueHashes[position]
+                else:
+                    valHash = await self.history.hashAsync(events[position].value)
+                topicCounts[valHash] = topicCounts.get(valHash, 0) + 1
+            if (empty[topic] > 0):
+                valHash = await self.history.hashAsync(None)
+                topicCounts[valHash] = topicCounts.get(
+                    valHash, 0) + empty[topic]
+        return counts
+
+    def _probs(self, counts: dict[str, dict[str, int]], total: int) -> dict[str, dict[str, float]]:
+        return {topic: {valHash: counts[topic][valHash] / total for valHash in counts[topic]} for topic in counts}
+
+    async def possibleCausesAsync(self, effects: List[Event], minTime: int = 0, maxTime: int = sys.maxsize, topK: int = None, normalize: bool = False) -> dict[str, dict[str, float]]:
+        sEffects = await self.similarEventsAsync(effects, minTime, maxTime)
+        handlers = self.pubHandlers(effects)
+        allOutHandlersEventsCount = await self.history.countOutsAsync(handlers, minTime, maxTime)
+        arrays: dict[str, _TopicArrays] = dict()
+        selected: dict[str, list[np.ndarray]] = dict()
+        empty: dict[str, int] = dict()
+        for effectTopic, initTimes in self._byTopic(sEffects, 'initTime').items():
+            for eventHandler in self.eventBroker.publishers([effectTopic]):
+                for topic in eventHandler.subscribedTopics:
+                    keys = (await self._topicArrays(arrays, topic, 'time', minTime, maxTime)).keys
+                    # Latest event with time <= initTime. On equal times, the first one in the order of the history.
+                    last = np.searchsorted(keys, initTimes, side='right') - 1
+                    found = last >= 0
+                    first = np.searchsorted(
+                        keys, keys[last[found]], side='left')
+                    # Only events with time > 0 are causes. Otherwise, an empty cause is used (see SimpleExplainer).
+                    valid = keys[first] > 0
+                    selected.setdefault(topic, []).append(first[valid])
+                    empty[topic] = empty.get(
+                        topic, 0) + int(len(initTimes) - np.count_nonzero(valid))
+        counts = await self._countValues(selected, empty, arrays)
+        return self.topKProbs(self._probs(counts, allOutHandlersEventsCount), topK, normalize)
+
+    async def possibleEffectsAsync(self, causes: List[Event], minTime: int = 0, maxTime: int = sys.maxsize, topK: int = None, normalize: bool = False) -> dict[str, dict[str, float]]:
+        similarCauses = await self.similarEventsAsync(causes, minTime, maxTime)
+        arrays: dict[str, _TopicArrays] = dict()
+        selected: dict[str, list[np.ndarray]] = dict()
+        empty: dict[str, int] = dict()
+        for causeTopic, times in self._byTopic(similarCauses, 'time').items():
+            for subscriber in self.eventBroker.subscribers([causeTopic]):
+                for topic in subscriber.publishedTopics:
+                    keys = (await self._topicArrays(arrays, topic, 'initTime', minTime, maxTime)).keys
+                    # Earliest event with initTime >= time. On equal times, the first one in the order of the history.
+                    first = np.searchsorted(keys, times, side='left')
+                    found = first < len(keys)
+                    valid = keys[first[found]] < sys.maxsize
+                    selected.setdefault(topic, []).append(first[found][valid])
+                    empty[topic] = empty.get(
+                        topic, 0) + int(len(times) - np.count_nonzero(valid))
+        # As in SimpleExplainer, outputs are counted for the publishers of the topics of the effects.
+        publishers = self.eventBroker.publishers(list(selected))
+        allOutHandlersEventsCount = await self.history.countOutsAsync(publishers, minTime, maxTime)
+        counts = await self._countValues(selected, empty, arrays)
+        return self.topKProbs(self._probs(counts, allOutHandlersEventsCount), topK, normalize)
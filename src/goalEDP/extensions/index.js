@@ -181,6 +181,7 @@ class Template {
 
 class Drawer {
   static pageLimit = 10;
+  static chainDepth = 3;
   static addEvent() {
     Drawer.showModal("add_event");
     document.querySelector("#add_event .modal-body").innerHTML = `
@@ -305,6 +306,8 @@ class Drawer {
                       <li><a class="dropdown-item" href="javascript:Drawer.drawExplanationLevel(Explainer.causesOfWithProbabilities,['${event.id}'],${
                 level - 1
               },${level})">Methods: causesOf + possibleCauses</a></li>
+                      <li><a class="dropdown-item" href="javascript:Drawer.drawExplanationChain('effects','${event.id}',${level})">Chain of effects (${Drawer.chainDepth} levels)</a></li>
+                      <li><a class="dropdown-item" href="javascript:Drawer.drawExplanationChain('causes','${event.id}',${level})">Chain of causes (${Drawer.chainDepth} levels)</a></li>
                     </ul>
                     <div class="event-container">${Template.event(event)}</div>
                   </div>
@@ -338,6 +341,65 @@ class Drawer {
     document.querySelector("#explanation_drawer .spinner-grow").style
       .display = "none";
   }
+  static async drawExplanationChain(direction, eventId, level) {
+    //all the levels are computed by the server in one request, then drawn as the levels of the other methods
+    const chain = await Explainer.explainChain(
+      [stateData["events"][eventId]],
+      direction,
+      Drawer.chainDepth,
+    );
+    const sign = direction == "causes" ? -1 : 1;
+    const levels = {};
+    for (const topic in chain.nodes) {
+      for (const valHash in chain.nodes[topic]) {
+        const node = chain.nodes[topic][valHash];
+        if (node.level == 0) {
+          continue;
+        }
+        if (!(node.level in levels)) {
+          levels[node.level] = { prData: {}, events: {} };
+        }
+        if (!(topic in levels[node.level].events)) {
+          levels[node.level].prData[topic] = {};
+          levels[node.level].events[topic] = {};
+        }
+        levels[node.level].prData[topic][valHash] = 0;
+        levels[node.level].events[topic][valHash] = [node.event];
+      }
+    }
+    for (const edge of chain.edges) { //probability of the edge towards the previous level
+      const [topic, valHash] = sign < 0 ? edge.cause : edge.effect;
+      const node = chain.nodes[topic][valHash];
+      if (node.level != 0) {
+        const prData = levels[node.level].prData;
+        prData[topic][valHash] = Math.max(
+          prData[topic][valHash],
+          edge.probability,
+        );
+      }
+    }
+    var eventIds = [eventId];
+    for (var d = 1; d <= Drawer.chainDepth; d++) {
+      const methodRes = levels[sign * d];
+      if (!methodRes) {
+        break;
+      }
+      await Drawer.drawExplanationLevel(
+        async () => methodRes,
+        eventIds,
+        level + sign * d,
+        level + sign * (d - 1),
+      );
+      eventIds = []; //ids may have been changed by merges
+      for (const topic in methodRes.events) {
+        for (const valHash in methodRes.events[topic]) {
+          for (const event of methodRes.events[topic][valHash]) {
+            eventIds.push(event.id);
+          }
+        }
+      }
+    }
+  }
   static updateStateEventsData(methodRes) {
     for (const topic in methodRes.events) { //update state data
       for (const valHash in methodRes.events[topic]) {
@@ -721,6 +783,22 @@ class Explainer {
       }),
     })).json();
   }
+  static async explainChain(events, direction, depth) {
+    return await (await fetch("/explain_chain", {
+      method: "POST",
+      headers: {
+        "Content-Type": "application/json",
+      },
+      body: JSON.stringify({
+        events: events,
+        direction: direction,
+        depth: depth,
+        minTime: parseInt(stateData["timeRange"]["minTime"]) || 0,
+        maxTime: parseInt(stateData["timeRange"]["maxTime"]) ||
+          Number.MAX_SAFE_INTEGER * 1000000,
+      }),
+    })).json();
+  }
   static async valueToHash(eventValue) {
     return await (await fetch("/value_to_hash", {
       method: "POST",
@@ -753,7 +831,8 @@ class Explainer {
       }),
     })).json();
   }
-  static async possibleEffects(causes) {
+  static async possibleEffects(causes, topK) {
+    //with topK, the server only returns the most probable values of each topic, so only these are filled
     const prData = await (await fetch("/possible_effects", {
       method: "POST",
       headers: {
@@ -761,6 +840,7 @@ class Explainer {
       },
       body: JSON.stringify({
         events: causes,
+        topK: topK,
         minTime: parseInt(stateData["timeRange"]["minTime"]) || 0,
         maxTime: parseInt(stateData["timeRange"]["maxTime"]) ||
           Number.MAX_SAFE_INTEGER * 1000000,
@@ -784,33 +864,7 @@ class Explainer {
   }
   //extra abstraction
   static async possibleEffectsMaxProbabilities(causes) {
-    const prData = (await Explainer.possibleEffects(causes)).prData;
-    const prMax = {};
-    for (const topic in prData) {
-      prMax[topic] = {};
-      var maxHash = Object.keys(prData[topic])[0];
-      for (const valHash in prData[topic]) {
-        if (prData[topic][valHash] > prData[topic][maxHash]) {
-          maxHash = valHash;
-        }
-      }
-      prMax[topic][maxHash] = prData[topic][maxHash];
-    }
-    const events = {};
-    for (const topic in prMax) {
-      events[topic] = {};
-      for (const valHash in prMax[topic]) {
-        events[topic][valHash] = await Explainer.fillEffect(
-          causes,
-          topic,
-          valHash,
-        );
-      }
-    }
-    return {
-      prData: prMax,
-      events: events,
-    };
+    return await Explainer.possibleEffects(causes, 1);
   }
   //extra abstraction
   static async effectsOfWithProbabilities(causes) {
@@ -849,7 +903,7 @@ class Explainer {
       }),
     })).json();
   }
-  static async possibleCauses(effects) {
+  static async possibleCauses(effects, topK) {
     const prData = await (await fetch("/possible_causes", {
       method: "POST",
       headers: {
@@ -857,6 +911,7 @@ class Explainer {
       },
       body: JSON.stringify({
         events: effects,
+        topK: topK,
         minTime: parseInt(stateData["timeRange"]["minTime"]) || 0,
         maxTime: parseInt(stateData["timeRange"]["maxTime"]) ||
           Number.MAX_SAFE_INTEGER * 1000000,
@@ -880,33 +935,7 @@ class Explainer {
   }
   //extra abstraction
   static async possibleCausesMaxProbabilities(effects) {
-    const prMax = {};
-    const prData = (await Explainer.possibleCauses(effects)).prData;
-    for (const topic in prData) {
-      prMax[topic] = {};
-      var maxHash = Object.keys(prData[topic])[0];
-      for (const valHash in prData[topic]) {
-        if (prData[topic][valHash] > prData[topic][maxHash]) {
-          maxHash = valHash;
-        }
-      }
-      prMax[topic][maxHash] = prData[topic][maxHash];
-    }
-    const events = {};
-    for (const topic in prMax) {
-      events[topic] = {};
-      for (const valHash in prMax[topic]) {
-        events[topic][valHash] = await Explainer.fillCause(
-          effects,
-          topic,
-          valHash,
-        );
-      }
-    }
-    return {
-      prData: prData,
-      events: events,
-    };
+    return await Explainer.possibleCauses(effects, 1);
   }
   //extra abstraction
   static async causesOfWithProbabilities(effects) {
@@ -2,6 +2,7 @@ from flask import Flask, request, Response
 import os
 from ..core import Explainer, EventHandler, Event, CoreJSONEncoder
 import json
+import sys
 from typing import Any, List, Self
 from .indexTemplate import indexTemplate
 
@@ -42,6 +43,27 @@ class WebGUI:
             hist: list[Event] = await self.explainer.history.getEventsAsync(filters)
             return CoreJSONEncoder().encode(hist)
 
+        @self.server.route('/aggregate', methods=['POST'])
+        async def aggregate():
+            reqData = request.json
+            try:
+                buckets = await self.explainer.history.aggregateAsync(topics=reqData["topics"], bucketNs=reqData["bucketNs"], minTime=reqData.get("minTime", 0), maxTime=reqData.get("maxTime", sys.maxsize))
+            except ValueError as e:
+                return CoreJSONEncoder().encode({"error": str(e)}), 400
+            return CoreJSONEncoder().encode(buckets)
+
+        @self.server.route('/state_at', methods=['POST'])
+        async def stateAt():
+            reqData = request.json
+            state = await self.explainer.history.stateAtAsync(time=reqData["time"], topics=reqData.get("topics"))
+            return CoreJSONEncoder().encode(state)
+
+        @self.server.route('/processing_stats', methods=['POST'])
+        async def processingStats():
+            reqData = request.json
+            stats = await self.explainer.history.processingStatsAsync(topic=reqData["topic"], minTime=reqData.get("minTime", 0), maxTime=reqData.get("maxTime", sys.maxsize))
+            return CoreJSONEncoder().encode(stats)
+
         @self.server.route('/fill_cause', methods=['POST'])
         async def fillCause():
             reqData = request.json
@@ -76,18 +98,26 @@ class WebGUI:
         async def possibleEffects():
             reqData = request.json
             causes: List[Event] = await parseEvents(reqData)
-            pr = await self.explainer.possibleEffectsAsync(causes=causes, minTime=reqData["minTime"], maxTime=reqData["maxTime"])
-            self.explainer.normalizeProbs(pr)
+            # Normalized over the whole distribution, then only the "topK" most probable values of each topic are sent.
+            pr = await self.explainer.possibleEffectsAsync(causes=causes, minTime=reqData["minTime"], maxTime=reqData["maxTime"], topK=reqData.get("topK"), normalize=True)
             return CoreJSONEncoder().encode(pr)
 
         @self.server.route('/possible_causes', methods=['POST'])
         async def possibleCauses():
             reqData = request.json
             effects: List[Event] = await parseEvents(reqData)
-            pr = await self.explainer.possibleCausesAsync(effects=effects, minTime=reqData["minTime"], maxTime=reqData["maxTime"])
-            self.explainer.normalizeProbs(pr)
+            pr = await self.explainer.possibleCausesAsync(effects=effects, minTime=reqData["minTime"], maxTime=reqData["maxTime"], topK=reqData.get("topK"), normalize=True)
             return CoreJSONEncoder().encode(pr)
 
+        @self.server.route('/explain_chain', methods=['POST'])
+        async def explainChain():
+            reqData = request.json
+            events: List[Event] = await parseEvents(reqData)
+            chain = await self.explainer.explainChainAsync(events=events, depth=reqData.get("depth", 1), direction=reqData.get("direction", "causes"),
+                                                           minProb=reqData.get("minProb", 0.0), maxFanout=reqData.get("maxFanout"),
+                                                           minTime=reqData["minTime"], maxTime=reqData["maxTime"])
+            return CoreJSONEncoder().encode(chain)
+
         @self.server.route('/hashes_to_value', methods=['POST'])
         async def hashesToValue():
             prData = request.json
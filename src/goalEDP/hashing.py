@@ -0,0 +1,119 @@
+from abc import ABC, abstractmethod
+from typing import Any
+from functools import lru_cache
+from deepdiff import DeepHash
+import hashlib
+import json
+
+
+class Hasher(ABC):
+    """
+    Computes the hashes of event values used by the Histories.
+    If two values are the same, the hash must be the same.
+    """
+
+    @abstractmethod
+    def hash(self, obj: Any) -> str:
+        """
+        @param obj: value/obj.
+        @return: obj/value hash.
+        """
+        pass
+
+
+class DeepHasher(Hasher):
+    """
+    Hashes values with "deepdiff.DeepHash". Slow, but supports any Python object.
+    """
+
+    def hash(self, obj: Any) -> str:
+        return DeepHash(obj)[obj]
+
+
+_SCALARS = frozenset([str, int, float, bool, type(None)])
+
+
+class JSONHasher(Hasher):
+    """
+    Hashes the canonical JSON (sorted keys, no spaces) of values with blake2b.
+    Event values must be JSON-serializable, so this is the default hasher.
+    Values that JSON cannot tell apart are tagged before they are encoded: tuples, sets, dicts with keys that are not strings, and objects (by their class and "__dict__", as in "Event.__iter__").
+    So {1: x} and {"1": x}, or (1, 2) and [1, 2], have different hashes. JSON values are encoded as they are. Other values raise a TypeError.
+    Hashes of scalar values (str, int, float, bool and None) and of JSON texts are kept in LRU caches.
+    """
+
+    # Keys of the single-key dicts that tag values. String keys that start with "\x00" get another "\x00", so no dict of the value has these keys.
+    _TUPLE = '\x00t'
+    _DICT = '\x00d'
+    _SET = '\x00s'
+    _OBJECT = '\x00o'
+
+    def __init__(self, cacheSize: int = 4096, digestSize: int = 16):
+        """
+        Constructor:
+        @param cacheSize: Maximum number of hashes kept by each LRU cache.
+        @param digestSize: Size of the blake2b digest, in bytes.
+        """
+        self.digestSize = digestSize
+        self._encoder = json.JSONEncoder(
+            sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+        # "typed" keeps 1, 1.0 and True apart, as their JSON texts are different.
+        self._hashScalar = lru_cache(maxsize=cacheSize, typed=True)(
+            lambda obj: self._hashText(self._encoder.encode(obj)))
+        self._hashText = lru_cache(maxsize=cacheSize)(self._digest)
+
+    def _digest(self, text: str) -> str:
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=self.digestSize).hexdigest()
+
+    def _canonical(self, obj: Any) -> Any:
+        """
+        @return: The value with its tuples, sets, dicts with keys that are not strings and objects tagged. Parts that need no tags are returned as they are (not copied).
+        """
+        if (obj is None) or isinstance(obj, (str, int, float)):
+            return obj
+        if isinstance(obj, list):
+            items = [self._canonical(item) for item in obj]
+            return obj if all(a is b for a, b in zip(items, obj)) else items
+        if isinstance(obj, dict):
+            if all(isinstance(key, str) for key in obj):
+                if not any(key.startswith('\x00') for key in obj):
+                    values = {key: self._canonical(value) for key, value in obj.items()}
+                    return obj if all(values[key] is obj[key] for key in obj) else values
+                return {('\x00' + key if key.startswith('\x00') else key): self._canonical(value) for key, value in obj.items()}
+            pairs = [[self._canonical(key), self._canonical(value)] for key, value in obj.items()]
+            return {self._DICT: sorted(pairs, key=lambda pair: self._encoder.encode(pair[0]))}
+        if isinstance(obj, tuple):
+            return {self._TUPLE: [self._canonical(item) for item in obj]}
+        if isinstance(obj, (set, frozenset)):
+            return {self._SET: sorted((self._canonical(item) for item in obj), key=self._encoder.encode)}
+        if hasattr(obj, '__dict__'):
+            return {self._OBJECT: [type(obj).__module__ + '.' + type(obj).__qualname__, self._canonical(obj.__dict__)]}
+        raise TypeError(
+            f'Values of type {type(obj).__name__} cannot be hashed by JSONHasher. Use JSON values, or DeepHasher.')
+
+    @staticmethod
+    def _isJSON(obj: Any) -> bool:
+        """
+        Fast check for values that need no tags: dicts with string keys (not starting with "\x00"), lists and scalars of the exact JSON types.
+        """
+        kind = type(obj)
+        if (kind is dict):
+            for key, value in obj.items():
+                if (type(key) is not str) or key.startswith('\x00'):
+                    return False
+                if (not type(value) in _SCALARS) and (not JSONHasher._isJSON(value)):
+                    return False
+            return True
+        if (kind is list):
+            for value in obj:
+                if (not type(value) in _SCALARS) and (not JSONHasher._isJSON(value)):
+                    return False
+            return True
+        return kind in _SCALARS
+
+    def hash(self, obj: Any) -> str:
+        if (obj is None) or isinstance(obj, (str, int, float)):
+            return self._hashScalar(obj)
+        if (not self._isJSON(obj)):
+            obj = self._canonical(obj)
+        return self._hashText(self._encoder.encode(obj))
@@ -0,0 +1,210 @@
+"""
+Compact binary format used to move histories between machines (see "History.exportToAsync" and "History.importFromAsync").
+
+The file starts with MAGIC and is followed by a zlib stream of records. Each record starts with a tag byte:
+- TOPIC: slot (varint), topic (varint length + UTF-8).
+- VALUE: slot (varint), value (varint length + JSON in UTF-8).
+- EVENT / EVENT_HEX_ID: topic slot, value slot (varints), time (zigzag varint, difference to the time of the previous event),
+  time - initTime (zigzag varint), id (16 raw bytes for EVENT_HEX_ID, used for the ids generated by "Event.genId", otherwise varint length + UTF-8).
+Topics and values are dictionary-encoded in tables with a fixed number of slots. When a table is full, the least recently used slot is redefined,
+so memory is bounded both when writing and when reading.
+"""
+
+from .core import Event, CoreJSONEncoder
+from typing import Any, BinaryIO, Iterator
+from collections import OrderedDict
+import hashlib
+import json
+import re
+import zlib
+
+MAGIC = b'GOALEDP-HISTORY\x01'
+TOPIC = 1
+VALUE = 2
+EVENT = 3
+EVENT_HEX_ID = 4
+_HEX_ID = re.compile('^[0-9a-f]{32}$')
+
+
+def _varint(n: int) -> bytes:
+    res = bytearray()
+    while (True):
+        byte = n & 0x7f
+        n >>= 7
+        if (n):
+            res.append(byte | 0x80)
+        else:
+            res.append(byte)
+            return bytes(res)
+
+
+def _zigzag(n: int) -> bytes:
+    return _varint((n << 1) if n >= 0 else ((-n << 1) - 1))
+
+
+def _text(text: str) -> bytes:
+    data = text.encode('utf-8')
+    return _varint(len(data)) + data
+
+
+class _SlotTable:
+    """
+    Dictionary encoding with a fixed number of slots and least recently used replacement.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._slots: OrderedDict[Any, int] = OrderedDict()
+
+    def slot(self, key: Any) -> tuple[int, bool]:
+        """
+        @return: The slot of the key, and if the slot must be (re)defined in the stream.
+        """
+        if (key in self._slots):
+            self._slots.move_to_end(key)
+            return self._slots[key], False
+        if (len(self._slots) < self.size):
+            slot = len(self._slots)
+        else:
+            slot = self._slots.popitem(last=False)[1]
+        self._slots[key] = slot
+        return slot, True
+
+
+class BinaryHistoryWriter:
+    """
+    Writes events in the compact binary format.
+    """
+
+    def __init__(self, file: BinaryIO, topicSlots: int = 4096, valueSlots: int = 65536, level: int = 6):
+        """
+        Constructor:
+        @param file: Binary file opened for writing.
+        @param topicSlots: Maximum number of topics kept in the dictionary.
+        @param valueSlots: Maximum number of distinct values kept in the dictionary.
+        @param level: zlib compression level.
+        """
+        self.file = file
+        self._topics = _SlotTable(topicSlots)
+        self._values = _SlotTable(valueSlots)
+        self._encoder = CoreJSONEncoder(separators=(',', ':'))
+        self._compressor = zlib.compressobj(level)
+        self._lastTime = 0
+        self.file.write(MAGIC)
+
+    def write(self, event: Event) -> None:
+        record = bytearray()
+        topicSlot, new = self._topics.slot(event.topic)
+        if (new):
+            record += bytes([TOPIC]) + _varint(topicSlot) + \
+                _text(event.topic)
+        value = self._encoder.encode(dict(event)['value'])
+        valueSlot, new = self._values.slot(
+            hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest())
+        if (new):
+            record += bytes([VALUE]) + _varint(valueSlot) + _text(value)
+        hexId = isinstance(event.id, str) and _HEX_ID.match(event.id)
+        record += bytes([EVENT_HEX_ID if hexId else EVENT]) + _varint(topicSlot) + _varint(valueSlot) + \
+            _zigzag(event.time - self._lastTime) + \
+            _zigzag(event.time - event.initTime)
+        record += bytes.fromhex(event.id) if hexId else _text(str(event.id))
+        self._lastTime = event.time
+        self.file.write(self._compressor.compress(bytes(record)))
+
+    def close(self) -> None:
+        """
+        Finishes the zlib stream. The file itself is not closed.
+        """
+        self.file.write(self._compressor.flush())
+
+
+class BinaryHistoryReader:
+    """
+    Reads events written by BinaryHistoryWriter, as a stream.
+    """
+
+    def __init__(self, file: BinaryIO, chunkSize: int = 1 << 16):
+        """
+        Constructor:
+        @param file: Binary file opened for reading.
+        @param chunkSize: Number of bytes read from the file at a time.
+        """
+        self.file = file
+        self.chunkSize = chunkSize
+        if (self.file.read(len(MAGIC)) != MAGIC):
+            raise Exception('Not a goalEDP binary history.')
+        self._decompressor = zlib.decompressobj()
+        self._buffer = b''
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        """
+        Reads more data into the buffer, discarding the part already parsed.
+        @return: False at the end of the stream.
+        """
+        if (self._eof):
+            return False
+        self._buffer = self._buffer[self._pos:]
+        self._pos = 0
+        chunk = self.file.read(self.chunkSize)
+        if (len(chunk) == 0):
+            self._buffer += self._decompressor.flush()
+            self._eof = True
+        else:
+            self._buffer += self._decompressor.decompress(chunk)
+        return True
+
+    def _bytes(self, n: int) -> bytes:
+        while (len(self._buffer) - self._pos < n):
+            if (not self._fill()):
+                raise Exception('Truncated binary history.')
+        data = self._buffer[self._pos:self._pos + n]
+        self._pos += n
+        return data
+
+    def _varint(self) -> int:
+        n = 0
+        shift = 0
+        while (True):
+            byte = self._bytes(1)[0]
+            n |= (byte & 0x7f) << shift
+            shift += 7
+            if (not byte & 0x80):
+                return n
+
+    def _zigzag(self) -> int:
+        n = self._varint()
+        return (n >> 1) if not n & 1 else -((n + 1) >> 1)
+
+    def _text(self) -> str:
+        return self._bytes(self._varint()).decode('utf-8')
+
+    def __iter__(self) -> Iterator[Event]:
+        topics: dict[int, str] = dict()
+        values: dict[int, Any] = dict()
+        lastTime = 0
+        while (True):
+            while (self._pos >= len(self._buffer)):
+                if (not self._fill()):
+                    return
+            tag = self._bytes(1)[0]
+            if (tag == TOPIC):
+                slot = self._varint()
+                topics[slot] = self._text()
+            elif (tag == VALUE):
+                slot = self._varint()
+                values[slot] = self._text()
+            elif (tag == EVENT) or (tag == EVENT_HEX_ID):
+                topic = topics[self._varint()]
+                value = json.loads(values[self._varint()])
+                time = lastTime + self._zigzag()
+                initTime = time - self._zigzag()
+                if (tag == EVENT_HEX_ID):
+                    id = self._bytes(16).hex()
+                else:
+                    id = self._text()
+                lastTime = time
+                yield Event(topic=topic, value=value, time=time, initTime=initTime, id=id)
+            else:
+                raise Exception(f'Unknown record {tag} in binary history.')
@@ -0,0 +1,170 @@
+from ..core import History, Event, EventHandler
+import copy
+from typing import Any, Awaitable, List
+from collections import deque
+import asyncio
+import sys
+import threading
+
+
+class BufferedHistory(History):
+    """
+    Wraps any History to delay its writes (write-behind), so that a slow History does not slow down the handlers.
+    Events are accepted into a bounded buffer in RAM and are saved in batches, by a background thread, when the buffer reaches "batchSize" events or every "flushInterval" seconds.
+    Reads see the buffered events (read-your-writes). The buffer is drained by "flush"/"flushAsync", which the EventBroker calls in "stopProcess".
+    The background thread runs an event loop of its own, and every call to the wrapped History is made in it, so Histories bound to an event loop can be wrapped.
+    Call "close" to flush the buffer and stop the thread.
+    """
+
+    def __init__(self, history: History, maxSize: int = 10000, batchSize: int = 500, flushInterval: float = 0.5):
+        """
+        Constructor:
+        @param history: History that actually saves the events.
+        @param maxSize: Maximum number of buffered events. When the buffer is full, writes wait for the background flush.
+        @param batchSize: Number of buffered events that triggers a flush.
+        @param flushInterval: Maximum time (in seconds) that an event waits in the buffer.
+        """
+        super().__init__()
+        self.history = history
+        self.maxSize = maxSize
+        self.batchSize = batchSize
+        self.flushInterval = flushInterval
+        self._buffer: deque[Event] = deque()
+        self._closed = False
+        # Used only in the loop of the background thread.
+        # Protects the buffer. Writers wait on it when the buffer is full, and the flush task waits on it for the thresholds.
+        self._condition = asyncio.Condition()
+        # Held while a batch is moved from the buffer to the wrapped History, so that reads never see a batch in neither place.
+        self._flushLock = asyncio.Lock()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._flushTask = asyncio.run_coroutine_threadsafe(
+            self._flushPeriodicallyAsync(), self._loop)
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    async def _inLoopAsync(self, coroutine: Awaitable) -> Any:
+        """
+        Runs a coroutine in the loop of the background thread, without blocking the loop of the caller.
+        """
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if (running is self._loop) or (self._loop.is_closed()):
+            # After "close", the buffer is empty and the wrapped History is called directly.
+            return await coroutine
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coroutine, self._loop))
+
+    async def _flushPeriodicallyAsync(self) -> None:
+        while (not self._closed):
+            async with self._condition:
+                try:
+                    await asyncio.wait_for(self._condition.wait_for(lambda: self._closed or len(self._buffer) >= self.batchSize), self.flushInterval)
+                except TimeoutError:
+                    pass
+                pending = len(self._buffer) > 0
+            if (pending):
+                await self._flushAsync()
+
+    async def _flushAsync(self) -> None:
+        async with self._flushLock:
+            async with self._condition:
+                batch = list(self._buffer)
+                self._buffer.clear()
+                self._condition.notify_all()
+            for event in batch:
+                await self.history.addEventAsync(event)
+            await self.history.flushAsync()
+
+    async def flushAsync(self) -> None:
+        await self._inLoopAsync(self._flushAsync())
+
+    async def _addEventAsync(self, event: Event) -> None:
+        async with self._condition:
+            if (len(self._buffer) >= self.maxSize):
+                self._condition.notify_all()
+                await self._condition.wait_for(lambda: len(self._buffer) < self.maxSize)
+            self._buffer.append(event)
+            if (len(self._buffer) >= self.batchSize):
+                self._condition.notify_all()
+
+    async def addEventAsync(self, event: Event) -> None:
+        if (self._closed):
+            raise Exception('The BufferedHistory is closed.')
+        await self._inLoopAsync(self._addEventAsync(copy.deepcopy(event)))
+
+    async def _getEventsAsync(self, filters: dict) -> List[Event]:
+        async with self._flushLock:
+            buffered = list(self._buffer)
+            start = 0
+            res: list[Event] = []
+            if ('cursor' in filters):
+                for index, event in enumerate(buffered):
+                    if (event.id == filters['cursor']):
+                        start = index + 1
+                        break
+            if (start == 0):
+                res = await self.history.getEventsAsync(filters)
+                if ('cursor' in filters) and (len(res) == 0):
+                    # The cursor may be the last saved event, or may not exist.
+                    if (len(await self.history.getEventsAsync({'ids': [filters['cursor']]})) == 0):
+                        return res
+            for event in buffered[start:]:
+                if ('limit' in filters):
+                    if (len(res) + 1 > filters['limit']):
+                        break
+                if (await self._satisfiesFiltersAsync(event, filters)):
+                    res.append(event)
+            return res
+
+    async def getEventsAsync(self, filters: dict) -> List[Event]:
+        """
+        Supports the filters of the wrapped History. Buffered events come after the saved ones.
+        """
+        return await self._inLoopAsync(self._getEventsAsync(filters))
+
+    async def _countOutsAsync(self, handlers: List[EventHandler], minTime: int, maxTime: int) -> int:
+        topics: set[str] = set()
+        for h in handlers:
+            for topic in h.publishedTopics:
+                topics.add(topic)
+        async with self._flushLock:
+            buffered = list(self._buffer)
+            count = await self.history.countOutsAsync(handlers, minTime, maxTime)
+            for event in buffered:
+                if (await self._satisfiesFiltersAsync(event, {'topics': topics, 'minTime': minTime, 'maxTime': maxTime})):
+                    count += 1
+            return count
+
+    async def countOutsAsync(self, handlers: List[EventHandler], minTime: int = 0, maxTime: int = sys.maxsize) -> int:
+        return await self._inLoopAsync(self._countOutsAsync(handlers, minTime, maxTime))
+
+    async def hashAsync(self, obj: Any) -> str:
+        return await self._inLoopAsync(self.history.hashAsync(obj))
+
+    async def objByHashAsync(self, hash: str) -> Any:
+        return await self._inLoopAsync(self.history.objByHashAsync(hash))
+
+    async def _closeAsync(self) -> None:
+        async with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        await asyncio.wrap_future(self._flushTask)
+        await self._flushAsync()
+
+    def close(self) -> None:
+        """
+        Saves the buffered events, then stops the background thread. Later writes raise an exception.
+        It blocks the calling thread until the thread stops.
+        """
+        if (not self._thread.is_alive()):
+            return
+        asyncio.run_coroutine_threadsafe(
+            self._closeAsync(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
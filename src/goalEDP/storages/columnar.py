@@ -0,0 +1,179 @@
+from ..core import History, Event, EventHandler
+import copy
+from typing import Any, List, AsyncIterator
+from ..hashing import Hasher, JSONHasher
+import numpy as np
+import sys
+import threading
+
+
+class ColumnarHistory(History):
+    """
+    A History that saves the events as NumPy columns, for analytical queries (large time-range scans).
+    The 'time' and 'initTime' of the events are int64 columns, topics and value hashes are dictionary-encoded to int32 columns, and the values are kept in a side store (by hash).
+    Filters and counts are vectorized. The columns grow by doubling their capacity, so appends are amortized.
+    Requires the optional dependency "numpy".
+    """
+
+    def __init__(self, capacity: int = 1024, hasher: Hasher = None):
+        """
+        Constructor:
+        @param capacity: Initial number of rows of the columns.
+        @param hasher: (optional) Hasher of the event values. Default: JSONHasher.
+        """
+        super().__init__()
+        if (hasher is None):
+            hasher = JSONHasher()
+        self.hasher = hasher
+        self._lock = threading.Lock()
+        self._size = 0
+        self._time = np.empty(capacity, dtype=np.int64)
+        self._initTime = np.empty(capacity, dtype=np.int64)
+        self._topic = np.empty(capacity, dtype=np.int32)
+        self._valueHash = np.empty(capacity, dtype=np.int32)
+        self._ids: list[str] = []
+        self._rowById: dict[str, int] = dict()
+        self._topics: list[str] = []
+        self._topicCodes: dict[str, int] = dict()
+        self._hashList: list[str] = []
+        self._hashCodes: dict[str, int] = dict()
+        self.hashes: dict[str, Any] = dict()
+
+    def _grow(self) -> None:
+        capacity = max(2 * len(self._time), 1)
+        for name in ('_time', '_initTime', '_topic', '_valueHash'):
+            column = getattr(self, name)
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:self._size] = column[:self._size]
+            setattr(self, name, grown)
+
+    def _encode(self, codes: dict[str, int], values: list[str], value: str) -> int:
+        if (not value in codes):
+            codes[value] = len(values)
+            values.append(value)
+        return codes[value]
+
+    def _codes(self, codes: dict[str, int], values: List[str]) -> np.ndarray:
+        """
+        Encodes the values of a filter. Values that were never stored are ignored, since no row can match them.
+        """
+        return np.array([codes[v] for v in values if v in codes], dtype=np.int32)
+
+    async def addEventAsync(self, event: Event) -> None:
+        valueHash = await self.hashAsync(copy.deepcopy(event.value))
+        with self._lock:
+            if (self._size == len(self._time)):
+                self._grow()
+            row = self._size
+            self._time[row] = event.time
+            self._initTime[row] = event.initTime
+            self._topic[row] = self._encode(
+                self._topicCodes, self._topics, event.topic)
+            self._valueHash[row] = self._encode(
+                self._hashCodes, self._hashList, valueHash)
+            self._ids.append(event.id)
+            self._rowById[event.id] = row
+            self._size += 1
+
+    def _mask(self, filters: dict) -> np.ndarray:
+        """
+        Applies the filters to the columns.
+        @return: Indexes of the rows that satisfy the filters, in insertion order.
+        """
+        with self._lock:
+            size = self._size
+            time = self._time[:size]
+            initTime = self._initTime[:size]
+            topic = self._topic[:size]
+            valueHash = self._valueHash[:size]
+        mask = np.ones(size, dtype=bool)
+        if ('cursor' in filters):
+            if (filters['cursor'] in self._rowById):
+                mask[:self._rowById[filters['cursor']] + 1] = False
+            else:
+                mask[:] = False
+        if ('ids' in filters):
+            rows = [self._rowById[id]
+                    for id in filters['ids'] if id in self._rowById]
+            idsMask = np.zeros(size, dtype=bool)
+            idsMask[np.array(rows, dtype=np.int64)] = True
+            mask &= idsMask
+        if ('topics' in filters):
+            mask &= np.isin(topic, self._codes(
+                self._topicCodes, filters['topics']))
+        if ('times' in filters):
+            mask &= np.isin(time, np.array(filters['times'], dtype=np.int64))
+        if ('valuesHashes' in filters):
+            mask &= np.isin(valueHash, self._codes(
+                self._hashCodes, filters['valuesHashes']))
+        if ('minTime' in filters):
+            mask &= initTime >= filters['minTime']
+        if ('maxTime' in filters):
+            mask &= time <= filters['maxTime']
+        if ('valueWhere' in filters):
+            # Values are dictionary-encoded, so the predicates are checked once per distinct value.
+            codes = [code for code in np.unique(valueHash[mask]).tolist()
+                     if History._satisfiesValueWhere(self.hashes[self._hashList[code]], filters['valueWhere'])]
+            mask &= np.isin(valueHash, np.array(codes, dtype=np.int32))
+        rows = np.flatnonzero(mask)
+        if ('limit' in filters):
+            rows = rows[:filters['limit']]
+        return rows
+
+    async def getEventsAsync(self, filters: dict) -> List[Event]:
+        """
+        Supports all the recommended filters ('ids', 'topics', 'times', 'valuesHashes', 'valueWhere', 'minTime', 'maxTime', 'limit' and 'cursor').
+        """
+        return [self._event(row) for row in self._mask(filters).tolist()]
+
+    async def iterEventsAsync(self, filters: dict, batchSize: int = 1000) -> AsyncIterator[Event]:
+        """
+        Filters the columns once and builds the Event instances in batches of "batchSize" rows.
+        """
+        rows = self._mask(filters)
+        for start in range(0, len(rows), batchSize):
+            for row in rows[start:start + batchSize].tolist():
+                yield self._event(row)
+
+    def _event(self, row: int) -> Event:
+        return Event(topic=self._topics[self._topic[row]], value=self.hashes[self._hashList[self._valueHash[row]]],
+                     time=int(self._time[row]), initTime=int(self._initTime[row]), id=self._ids[row])
+
+    async def getColumnsAsync(self, filters: dict, columns: List[str] = None) -> dict[str, np.ndarray]:
+        """
+        Vectorized alternative to "getEventsAsync", which does not build Event instances.
+        Useful, for example, to compute statistics over the times of a topic. VectorizedExplainer uses it to recover the events of the related topics.
+        @param filters: Same filters as "getEventsAsync".
+        @param columns: Columns to return: 'time', 'initTime', 'topic' (codes), 'valueHash' (codes) and 'hash' (the value hashes). Default: ['time', 'initTime'].
+        @return: A dict of NumPy arrays (by column), in insertion order.
+        """
+        if (columns is None):
+            columns = ['time', 'initTime']
+        rows = self._mask(filters)
+        res = dict()
+        for name in columns:
+            if (name == 'hash'):
+                codes = self._valueHash[rows]
+                res[name] = np.array(self._hashList, dtype=object)[codes] if len(codes) > 0 else np.empty(0, dtype=object)
+            else:
+                res[name] = getattr(self, '_' + name)[rows]
+        return res
+
+    async def countOutsAsync(self, handlers: List[EventHandler], minTime: int = 0, maxTime: int = sys.maxsize) -> int:
+        topics: set[str] = set()
+        for h in handlers:
+            for topic in h.publishedTopics:
+                topics.add(topic)
+        return len(self._mask({'topics': list(topics), 'minTime': minTime, 'maxTime': maxTime}))
+
+    async def hashAsync(self, obj: Any) -> str:
+        hash = self.hasher.hash(obj)
+        if (not hash in self.hashes):
+            self.hashes[hash] = obj
+        return hash
+
+    async def objByHashAsync(self, hash: str) -> Any:
+        if (hash in self.hashes):
+            return self.hashes[hash]
+        else:
+            raise Exception(f'Hash {hash} not found in history.')
@@ -1,80 +1,657 @@
-from ..core import History, Event, EventHandler
+from ..core import History, Event, EventHandler, ProcessingStats
 import copy
-from typing import Any, List
-from deepdiff import DeepHash
+from typing import Any, List, AsyncIterator, Callable, Iterable
+from ..hashing import Hasher, JSONHasher
+import bisect
+import heapq
+import itertools
 import sys
+import threading
+import time
+
+
+class _TopicTimes:
+    """
+    Times of the events of a topic, sorted by "time", used to count events without building lists of events, and to find the events of a time range.
+    """
+
+    def __init__(self):
+        self.times: list[int] = []
+        # "initTime" and positions (in "InMemoryHistory.events") of the events, in the same order as "times".
+        self.initTimes: list[int] = []
+        self.positions: list[int] = []
+        # Largest "time - initTime" and "initTime - time" seen. They bound the region where "time" alone does not decide the "minTime" filter.
+        self.maxDuration = 0
+        self.maxAdvance = 0
+
+    def add(self, time: int, initTime: int, position: int) -> None:
+        pos = bisect.bisect_right(self.times, time)
+        self.times.insert(pos, time)
+        self.initTimes.insert(pos, initTime)
+        self.positions.insert(pos, position)
+        self.maxDuration = max(self.maxDuration, time - initTime)
+        self.maxAdvance = max(self.maxAdvance, initTime - time)
+
+    def window(self, minTime: int, maxTime: int) -> tuple[int, int]:
+        """
+        Range of indexes that contains all the events with "initTime" >= minTime and "time" <= maxTime (and possibly some others, near minTime).
+        """
+        return bisect.bisect_left(self.times, minTime - self.maxAdvance), bisect.bisect_right(self.times, maxTime)
+
+    def equal(self, time: int) -> tuple[int, int]:
+        """
+        Range of indexes of the events with the given "time".
+        """
+        return bisect.bisect_left(self.times, time), bisect.bisect_right(self.times, time)
+
+    def between(self, start: int, end: int) -> tuple[int, int]:
+        """
+        Range of indexes of the events with "time" in [start, end).
+        """
+        return bisect.bisect_left(self.times, start), bisect.bisect_left(self.times, end)
+
+    def count(self, minTime: int, maxTime: int) -> int:
+        """
+        Counts the events with "initTime" >= minTime and "time" <= maxTime.
+        Binary searches give the events with "time" in [minTime, maxTime]. Only the events whose "time" is close to minTime (within the largest duration) are checked one by one.
+        """
+        lo = bisect.bisect_left(self.times, minTime)
+        hi = bisect.bisect_right(self.times, maxTime)
+        count = max(hi - lo, 0)
+        # Events with "time" >= minTime, but "initTime" < minTime.
+        end = min(bisect.bisect_left(
+            self.times, minTime + self.maxDuration), hi)
+        for i in range(lo, end):
+            if (self.initTimes[i] < minTime):
+                count -= 1
+        # Events with "time" < minTime, but "initTime" >= minTime.
+        start = bisect.bisect_left(self.times, minTime - self.maxAdvance)
+        for i in range(start, lo):
+            if (self.initTimes[i] >= minTime) and (self.times[i] <= maxTime):
+                count += 1
+        return count
+
+
+class _Rollup:
+    """
+    Counts of the events of a topic (total, and per value hash) per base bucket of time, maintained on each write.
+    """
+
+    def __init__(self, rollupNs: int):
+        self.rollupNs = rollupNs
+        # Sorted starts of the buckets with events.
+        self.starts: list[int] = []
+        # Bucket start -> [count, smallest initTime, {value hash: count}].
+        self.buckets: dict[int, list] = dict()
+
+    def add(self, time: int, initTime: int, valueHash: str) -> None:
+        start = (time // self.rollupNs) * self.rollupNs
+        if (not start in self.buckets):
+            bisect.insort(self.starts, start)
+            self.buckets[start] = [0, initTime, dict()]
+        bucket = self.buckets[start]
+        bucket[0] += 1
+        bucket[1] = min(bucket[1], initTime)
+        bucket[2][valueHash] = bucket[2].get(valueHash, 0) + 1
+
+
+class _ValueIndex:
+    """
+    Secondary index on a field of the values of a topic (see "InMemoryHistory.createValueIndex").
+    Numbers are kept sorted (for ranges and equality). Other values are grouped by their canonical JSON (for equality).
+    """
+
+    def __init__(self, path: str | List):
+        self.path = path
+        self.numbers: list[int | float] = []
+        # Positions (in "InMemoryHistory.events") of the events, in the same order as "numbers".
+        self.numberPositions: list[int] = []
+        self.others: dict[str, list[int]] = dict()
+
+    def add(self, value: Any, position: int) -> None:
+        found, field = History._valueAt(value, self.path)
+        if (not found):
+            return
+        if (History._isNumber(field)):
+            pos = bisect.bisect_right(self.numbers, field)
+            self.numbers.insert(pos, field)
+            self.numberPositions.insert(pos, position)
+        else:
+            self.others.setdefault(
+                History._canonicalValue(field), []).append(position)
+
+    @staticmethod
+    def supports(predicate: dict) -> bool:
+        op = predicate.get('op', '==')
+        if (op in ('==', 'in')):
+            return True
+        return (op in ('<', '<=', '>', '>=')) and History._isNumber(predicate.get('value'))
+
+    def _equal(self, value: Any) -> tuple[list[int], int, int]:
+        if (History._isNumber(value)):
+            return self.numberPositions, bisect.bisect_left(self.numbers, value), bisect.bisect_right(self.numbers, value)
+        positions = self.others.get(History._canonicalValue(value), [])
+        return positions, 0, len(positions)
+
+    def ranges(self, predicate: dict) -> List[tuple[list[int], int, int]]:
+        """
+        Positions of the events that satisfy a predicate (see "supports"), as slices (list, start, end) of the index lists.
+        """
+        op = predicate.get('op', '==')
+        value = predicate.get('value')
+        if (op == '=='):
+            return [self._equal(value)]
+        if (op == 'in'):
+            # Equal values (for example, 3 and 3.0) would produce the same slice twice.
+            distinct = dict()
+            for v in value:
+                key = ('number', v) if History._isNumber(v) else ('other', History._canonicalValue(v))
+                distinct.setdefault(key, v)
+            return [self._equal(v) for v in distinct.values()]
+        if (op == '<'):
+            return [(self.numberPositions, 0, bisect.bisect_left(self.numbers, value))]
+        if (op == '<='):
+            return [(self.numberPositions, 0, bisect.bisect_right(self.numbers, value))]
+        if (op == '>'):
+            return [(self.numberPositions, bisect.bisect_right(self.numbers, value), len(self.numbers))]
+        return [(self.numberPositions, bisect.bisect_left(self.numbers, value), len(self.numbers))]
 
 
 class InMemoryHistory(History):
     """
     A History that saves all events in RAM. Useful for academic purposes.
     For an application in production, it can generate a prohibitive cost of RAM memory.
+    It is safe for concurrent writers and readers (for example, the threads of GoalBroker and the WebGUI), without a global lock:
+    each write takes a number from an atomic sequence, and events are published to "self.events" in sequence order, so readers always see an ordered prefix of the writes.
+    Queries are planned (see "explain"): the most selective index (ids, values hashes, topics, time ranges, times or value fields) produces the candidates, and the other filters are checked on them.
+    Indexes on fields of the values, used by the 'valueWhere' filter, are declared with "createValueIndex".
     """
 
-    def __init__(self):
+    # An index is intersected with the chosen one when it is at most this number of times larger.
+    INTERSECT_FACTOR = 4
+
+    def __init__(self, hasher: Hasher = None, rollupNs: int = 1000000000, statsWindow: int = None):
+        """
+        Constructor:
+        @param hasher: (optional) Hasher of the event values. Default: JSONHasher.
+        @param rollupNs: Size (in nanoseconds) of the base buckets of the rollups used by "aggregateAsync". Aggregations with buckets that are multiples of it are served from the rollups.
+        @param statsWindow: (optional) Number of latest events per topic considered by "processingStatsAsync" without a time range. Default: all.
+        """
         super().__init__()
+        if (hasher is None):
+            hasher = JSONHasher()
+        self.hasher = hasher
         self.events: list[Event] = []
         self.hashes: dict[str, Any] = dict()
+        # Hashes of the values of "self.events", in the same order, so that filters do not hash values again.
+        self._valueHashes: list[str] = []
+        self._topicTimes: dict[str, _TopicTimes] = dict()
+        # Positions (in "self.events") by topic, value hash and id, in ascending order.
+        self._topicPositions: dict[str, list[int]] = dict()
+        self._hashPositions: dict[str, list[int]] = dict()
+        self._idPositions: dict[str, list[int]] = dict()
+        self.rollupNs = rollupNs
+        self._rollups: dict[str, _Rollup] = dict()
+        self.statsWindow = statsWindow
+        self._processingStats: dict[str, ProcessingStats] = dict()
+        # Secondary indexes on value fields: topic -> path -> index.
+        self._valueIndexes: dict[str, dict[str, _ValueIndex]] = dict()
+        # Writes waiting to be published, by sequence number.
+        self._sequence = itertools.count()
+        self._pending: dict[int, tuple[Event, str]] = dict()
+        self._published = 0
+        self._publishLock = threading.Lock()
+        # Striped locks that protect the per-topic indexes.
+        self._topicLocks = [threading.Lock() for _ in range(16)]
+
+    def createValueIndex(self, topic: str, path: str | List) -> None:
+        """
+        Declares an index on a field of the values of a topic, so that 'valueWhere' predicates on that path ('==', 'in' and, with numbers, '<', '<=', '>' and '>=') do not scan the events.
+        Queries use it only when all the topics of the query have an index on the path. Events already saved are indexed.
+        @param topic: Topic of the events.
+        @param path: Path of the field, as in the 'valueWhere' filter (see "History.getEventsAsync").
+        """
+        key = self._pathKey(path)
+        index = _ValueIndex(path)
+        # Holding the publish lock, no event is published while the existing ones are indexed.
+        with self._publishLock:
+            for position in self._topicPositions.get(topic, []):
+                index.add(self.events[position].value, position)
+            with self._topicLock(topic):
+                self._valueIndexes.setdefault(topic, dict())[key] = index
+        self._publish()
+
+    @staticmethod
+    def _pathKey(path: str | List) -> str:
+        return path if isinstance(path, str) else '.'.join(str(key) for key in path)
 
     async def getEventsAsync(self, filters: dict) -> List[Event]:
-        res: list[Event] = []
-        cursor = True
+        """
+        Supports all the recommended filters ('ids', 'topics', 'times', 'valuesHashes', 'valueWhere', 'minTime', 'maxTime', 'limit' and 'cursor').
+        """
+        return [event async for event in self.iterEventsAsync(filters)]
+
+    def _merge(self, lists: List[list[int]], cursor: int) -> Iterable[int]:
+        """
+        Merges lists of positions in ascending order, starting after the cursor.
+        """
+        return heapq.merge(*[itertools.islice(positions, bisect.bisect_right(positions, cursor), None) for positions in lists])
+
+    def _windows(self, topics: Iterable[str], ranges: Callable[[_TopicTimes], List[tuple[int, int]]], positions: bool) -> List[list[int]] | int:
+        """
+        Uses the given index ranges of the time index of each topic.
+        @param positions: If True, returns the positions of the events in the ranges. Otherwise, only counts them (to estimate, without copying them).
+        """
+        res = []
+        count = 0
+        for topic in topics:
+            topicTimes = self._topicTimes[topic]
+            with self._topicLock(topic):
+                for lo, hi in ranges(topicTimes):
+                    count += max(hi - lo, 0)
+                    if (positions):
+                        res.append(topicTimes.positions[lo:hi])
+        return res if positions else count
+
+    def _valuePositions(self, topics: Iterable[str], key: str, predicate: dict, positions: bool) -> List[int] | int:
+        """
+        Uses the value indexes of the topics to find the events that satisfy a 'valueWhere' predicate.
+        @param positions: If True, returns the positions of the events (in any order). Otherwise, only counts them.
+        """
+        res = []
+        count = 0
+        for topic in topics:
+            with self._topicLock(topic):
+                for values, lo, hi in self._valueIndexes[topic][key].ranges(predicate):
+                    count += max(hi - lo, 0)
+                    if (positions):
+                        res.extend(values[lo:hi])
+        return res if positions else count
+
+    def _accessPaths(self, filters: dict, cursor: int) -> dict[str, tuple[int, Callable[[], Iterable[int]]]]:
+        """
+        Ways of producing the candidate positions of a query, with the estimated number of candidates of each one.
+        @return: A dict: name -> (estimate, function that returns the candidate positions in ascending order).
+        """
+        size = len(self.events)
+        paths = dict()
+        paths['scan'] = (max(size - cursor - 1, 0),
+                         lambda: range(cursor + 1, size))
+        if ('ids' in filters):
+            ids = [self._idPositions[id]
+                   for id in set(filters['ids']) if id in self._idPositions]
+            paths['ids'] = (sum(len(positions) for positions in ids),
+                            lambda: self._merge(ids, cursor))
+        if ('valuesHashes' in filters):
+            hashes = [self._hashPositions[hash]
+                      for hash in set(filters['valuesHashes']) if hash in self._hashPositions]
+            paths['valuesHashes'] = (sum(len(positions) for positions in hashes),
+                                     lambda: self._merge(hashes, cursor))
+        topics = list(self._topicTimes)
+        if ('topics' in filters):
+            topics = [topic for topic in set(
+                filters['topics']) if topic in self._topicTimes]
+            topicsPositions = [self._topicPositions[topic]
+                               for topic in topics]
+            paths['topics'] = (sum(len(positions) for positions in topicsPositions),
+                               lambda: self._merge(topicsPositions, cursor))
+        if ('times' in filters):
+            times = set(filters['times'])
+            def timesRanges(topicTimes): return [
+                topicTimes.equal(t) for t in times]
+            paths['times'] = (self._windows(topics, timesRanges, False),
+                              lambda: sorted(p for w in self._windows(topics, timesRanges, True) for p in w if p > cursor))
+        if ('minTime' in filters) or ('maxTime' in filters):
+            minTime = filters.get('minTime', -sys.maxsize)
+            maxTime = filters.get('maxTime', sys.maxsize)
+            def timeRanges(topicTimes): return [
+                topicTimes.window(minTime, maxTime)]
+            paths['timeRange'] = (self._windows(topics, timeRanges, False),
+                                  lambda: sorted(p for w in self._windows(topics, timeRanges, True) for p in w if p > cursor))
+        for i, predicate in enumerate(filters.get('valueWhere', [])):
+            key = self._pathKey(predicate['path'])
+            if (not _ValueIndex.supports(predicate)) or (not all(key in self._valueIndexes.get(topic, {}) for topic in topics)):
+                continue
+            paths[f'valueWhere:{i}'] = (self._valuePositions(topics, key, predicate, False),
+                                        lambda key=key, predicate=predicate: sorted(set(p for p in self._valuePositions(topics, key, predicate, True) if p > cursor)))
+        return paths
+
+    def _plan(self, filters: dict) -> dict:
+        """
+        Chooses how a query is executed.
+        """
+        plan = {'cursor': -1, 'access': None, 'intersect': [], 'estimates': dict(), 'paths': dict(), 'check': []}
         if ('cursor' in filters):
-            cursor = False
-        for event in self.events:
-            satisfyConditions = True
-            if ('cursor' in filters):
-                if (event.id == filters['cursor']):
-                    cursor = True
-                    continue
-            if (not cursor):
-                satisfyConditions = False
-            if ('ids' in filters):
-                if (not event.id in filters['ids']):
-                    satisfyConditions = False
-            if ('topics' in filters):
-                if (not event.topic in filters['topics']):
-                    satisfyConditions = False
-            if ('times' in filters):
-                if (not event.time in filters['times']):
-                    satisfyConditions = False
-            if ('valuesHashes' in filters):
-                if (not (await self.hashAsync(event.value)) in filters['valuesHashes']):
-                    satisfyConditions = False
-            if ('minTime' in filters):
-                if (event.initTime < filters['minTime']):
-                    satisfyConditions = False
-            if ('maxTime' in filters):
-                if (event.time > filters['maxTime']):
-                    satisfyConditions = False
+            if (not filters['cursor'] in self._idPositions):
+                return plan
+            plan['cursor'] = self._idPositions[filters['cursor']][0]
+        paths = self._accessPaths(filters, plan['cursor'])
+        plan['paths'] = paths
+        plan['estimates'] = {name: paths[name][0] for name in paths}
+        access = min(paths, key=lambda name: paths[name][0])
+        plan['access'] = access
+        for name in paths:
+            if (name != access) and (name != 'scan') and (paths[name][0] <= self.INTERSECT_FACTOR * paths[access][0]):
+                plan['intersect'].append(name)
+        plan['check'] = self._unsatisfied(filters, [access] + plan['intersect'])
+        return plan
+
+    @staticmethod
+    def _unsatisfied(filters: dict, used: List[str]) -> List[str]:
+        """
+        Filters that still have to be checked on the candidates of the given access paths ('valueWhere:i' is the i-th predicate of 'valueWhere').
+        The indexes on times, time ranges and values are searched only in the topics of the query. A time range may include events with "initTime" < 'minTime'.
+        """
+        satisfied = set()
+        for name in used:
+            if (name in ('ids', 'valuesHashes', 'topics')):
+                satisfied.add(name)
+            elif (name == 'times'):
+                satisfied.update(['times', 'topics'])
+            elif (name == 'timeRange'):
+                satisfied.update(['maxTime', 'topics'])
+            elif (name.startswith('valueWhere:')):
+                satisfied.update([name, 'topics'])
+        names = [name for name in ['ids', 'topics', 'times', 'valuesHashes', 'minTime', 'maxTime'] if name in filters]
+        names += [f'valueWhere:{i}' for i in range(len(filters.get('valueWhere', [])))]
+        return [name for name in names if not name in satisfied]
+
+    def explain(self, filters: dict) -> dict:
+        """
+        Shows how "getEventsAsync" would execute a query.
+        @param filters: Same filters as "getEventsAsync".
+        @return: A dict, as in the example: {
+                                              'access': 'topics', (index that produces the candidates, or 'scan'. None if the cursor does not exist)
+                                              'estimates': {'scan': 5000, 'topics': 120, 'timeRange': 300}, (estimated candidates of each index. 'valueWhere:i' is the index of the i-th predicate of 'valueWhere')
+                                              'intersect': ['timeRange'], (indexes intersected with the candidates)
+                                              'check': ['minTime', 'valueWhere:1'], (filters checked on each candidate, that is, the ones the indexes used do not satisfy)
+                                              'cursor': 10, (position after which the events are returned)
+                                              'limit': 10
+                                            }
+        """
+        plan = self._plan(filters)
+        return {
+            'access': plan['access'],
+            'estimates': plan['estimates'],
+            'intersect': plan['intersect'],
+            'check': plan['check'],
+            'cursor': plan['cursor'] if 'cursor' in filters else None,
+            'limit': filters.get('limit')
+        }
+
+    async def iterEventsAsync(self, filters: dict, batchSize: int = 1000) -> AsyncIterator[Event]:
+        """
+        Streams the events following the plan of the query (see "explain"). "batchSize" is not used.
+        """
+        # Events saved during the iteration are not returned.
+        size = len(self.events)
+        plan = self._plan(filters)
+        if (plan['access'] is None):
+            return
+        paths = plan['paths']
+        check = {name: filters[name]
+                 for name in plan['check'] if not name.startswith('valueWhere:')}
+        predicates = [filters['valueWhere'][int(name.split(':')[1])]
+                      for name in plan['check'] if name.startswith('valueWhere:')]
+        if (len(predicates) > 0):
+            check['valueWhere'] = predicates
+        intersections = [set(paths[name][1]()) for name in plan['intersect']]
+        count = 0
+        for position in paths[plan['access']][1]():
+            if (position >= size):
+                break
             if ('limit' in filters):
-                if (len(res) + 1 > filters['limit']):
+                if (count + 1 > filters['limit']):
                     break
-            if (satisfyConditions):
-                res.append(event)
-        return res
+            if (not all(position in candidates for candidates in intersections)):
+                continue
+            event = self.events[position]
+            if (await self._satisfiesFiltersAsync(event, check, self._valueHashes[position])):
+                count += 1
+                yield event
 
     async def countOutsAsync(self, handlers: List[EventHandler], minTime: int = 0, maxTime: int = sys.maxsize) -> int:
         topics: set[str] = set()
         for h in handlers:
             for topic in h.publishedTopics:
                 topics.add(topic)
-        events = await self.getEventsAsync({'topics': list(topics), 'minTime': minTime, 'maxTime': maxTime})
-        return len(events)
+        count = 0
+        for topic in topics:
+            if (topic in self._topicTimes):
+                with self._topicLock(topic):
+                    count += self._topicTimes[topic].count(minTime, maxTime)
+        return count
 
-    async def hashAsync(self, obj: Any) -> str:
-        hash = DeepHash(obj)[obj]
+    async def aggregateAsync(self, topics: List[str], bucketNs: int, minTime: int = 0, maxTime: int = sys.maxsize) -> dict[str, dict[int, dict]]:
+        """
+        Served from the rollups when "bucketNs" is a multiple of "rollupNs": base buckets entirely inside the time range are added as they are,
+        and only the base buckets at the edges of the range are computed from the events. Otherwise, events are counted from the time index of each topic.
+        """
+        History._checkBucket(bucketNs)
+        res: dict[str, dict[int, dict]] = dict()
+        for topic in set(topics):
+            if (not topic in self._topicTimes):
+                continue
+            buckets: dict[int, dict] = dict()
+            with self._topicLock(topic):
+                topicTimes = self._topicTimes[topic]
+
+                def count(lo: int, hi: int) -> None:
+                    # Counts the events of the indexes [lo, hi) of the time index.
+                    for i in range(lo, hi):
+                        if (topicTimes.initTimes[i] < minTime) or (topicTimes.times[i] > maxTime):
+                            continue
+                        bucket = buckets.setdefault(
+                            (topicTimes.times[i] // bucketNs) * bucketNs, {'count': 0, 'values': dict()})
+                        valueHash = self._valueHashes[topicTimes.positions[i]]
+                        bucket['count'] += 1
+                        bucket['values'][valueHash] = bucket['values'].get(valueHash, 0) + 1
+
+                if (bucketNs % self.rollupNs != 0):
+                    count(*topicTimes.window(minTime, maxTime))
+                else:
+                    rollup = self._rollups[topic]
+                    lo, hi = topicTimes.window(minTime, maxTime)
+                    if (lo < hi):
+                        starts = rollup.starts[bisect.bisect_left(rollup.starts, (topicTimes.times[lo] // self.rollupNs) * self.rollupNs):
+                                               bisect.bisect_right(rollup.starts, topicTimes.times[hi - 1])]
+                    else:
+                        starts = []
+                    for start in starts:
+                        total, minInitTime, values = rollup.buckets[start]
+                        if (minInitTime >= minTime) and (start + self.rollupNs - 1 <= maxTime):
+                            bucket = buckets.setdefault(
+                                (start // bucketNs) * bucketNs, {'count': 0, 'values': dict()})
+                            bucket['count'] += total
+                            for valueHash in values:
+                                bucket['values'][valueHash] = bucket['values'].get(
+                                    valueHash, 0) + values[valueHash]
+                        else:
+                            count(*topicTimes.between(start, start + self.rollupNs))
+            if (len(buckets) > 0):
+                res[topic] = buckets
+        return res
+
+    async def stateAtAsync(self, time: int, topics: List[str] = None) -> dict[str, Event]:
+        """
+        Binary search on the time index of each topic: O(topics * log(n)).
+        """
+        # Events saved during the call are not considered.
+        size = len(self.events)
+        if (topics is None):
+            topics = list(self._topicTimes)
+        res: dict[str, Event] = dict()
+        for topic in set(topics):
+            if (not topic in self._topicTimes):
+                continue
+            with self._topicLock(topic):
+                topicTimes = self._topicTimes[topic]
+                # Events with the same time are kept in the order they were saved, so the last one is the latest saved.
+                i = bisect.bisect_right(topicTimes.times, time) - 1
+                while (i >= 0) and (topicTimes.positions[i] >= size):
+                    i -= 1
+                if (i >= 0):
+                    res[topic] = self.events[topicTimes.positions[i]]
+        return res
+
+    async def processingStatsAsync(self, topic: str, minTime: int = 0, maxTime: int = sys.maxsize) -> dict:
+        """
+        Without a time range, the statistics maintained as events are saved are returned (windowed, if "statsWindow" was given), in constant time.
+        With a time range, the events of the topic in the range are streamed.
+        """
+        if (minTime > 0) or (maxTime < sys.maxsize):
+            return await super().processingStatsAsync(topic, minTime, maxTime)
+        with self._topicLock(topic):
+            if (not topic in self._processingStats):
+                return ProcessingStats().summary()
+            return self._processingStats[topic].summary()
+
+    def _hash(self, obj: Any) -> str:
+        hash = self.hasher.hash(obj)
         if (not hash in self.hashes):
             self.hashes[hash] = obj
         return hash
 
+    async def hashAsync(self, obj: Any) -> str:
+        return self._hash(obj)
+
     async def objByHashAsync(self, hash: str) -> Any:
         if (hash in self.hashes):
             return self.hashes[hash]
         else:
             raise Exception(f'Hash {hash} not found in history.')
 
-    async def addEventAsync(self, event: Event) -> None:
+    def _topicLock(self, topic: str) -> threading.Lock:
+        return self._topicLocks[hash(topic) % len(self._topicLocks)]
+
+    def _publish(self) -> None:
+        """
+        Moves the pending writes, in sequence order, to "self.events" and to the indexes.
+        Only one thread publishes at a time. The others do not wait for it: their writes stay pending, and are published by the thread that holds the lock.
+        """
+        while (True):
+            if (not self._publishLock.acquire(blocking=False)):
+                return
+            try:
+                while (self._published in self._pending):
+                    event, valueHash = self._pending.pop(self._published)
+                    position = self._published
+                    # Indexes are updated before "self.events", since readers only consider positions lower than its length.
+                    # The value hash goes first, as the per-topic indexes (read by "aggregateAsync") refer to it.
+                    self._valueHashes.append(valueHash)
+                    with self._topicLock(event.topic):
+                        if (not event.topic in self._topicTimes):
+                            self._topicPositions[event.topic] = []
+                            self._topicTimes[event.topic] = _TopicTimes()
+                        self._topicTimes[event.topic].add(
+                            event.time, event.initTime, position)
+                        if (not event.topic in self._rollups):
+                            self._rollups[event.topic] = _Rollup(
+                                self.rollupNs)
+                        self._rollups[event.topic].add(
+                            event.time, event.initTime, valueHash)
+                        if (not event.topic in self._processingStats):
+                            self._processingStats[event.topic] = ProcessingStats(
+                                self.statsWindow)
+                        self._processingStats[event.topic].add(event)
+                        for index in self._valueIndexes.get(event.topic, {}).values():
+                            index.add(event.value, position)
+                    self._topicPositions[event.topic].append(position)
+                    self._hashPositions.setdefault(
+                        valueHash, []).append(position)
+                    self._idPositions.setdefault(
+                        event.id, []).append(position)
+                    self.events.append(event)
+                    self._published += 1
+            finally:
+                self._publishLock.release()
+            # A write may have become pending after the last check, while its thread failed to get the lock.
+            if (not self._published in self._pending):
+                return
+
+    def _withoutOldest(self, count: int) -> 'InMemoryHistory':
+        """
+        A new InMemoryHistory with all the events except the oldest "count" ones (used by TieredHistory to move them to the cold tier).
+        The events and values are shared, not copied or hashed again: the indexes are sliced and their positions shifted.
+        Hashes of objects that are not values of the remaining events are not kept.
+        """
+        res = InMemoryHistory(self.hasher, self.rollupNs, self.statsWindow)
+        # Holding the publish lock, no event is published while the indexes are sliced.
+        with self._publishLock:
+            size = len(self.events)
+            count = min(count, size)
+
+            def shift(positions: list[int]) -> list[int]:
+                return [p - count for p in positions[bisect.bisect_left(positions, count):]]
+
+            res.events = self.events[count:size]
+            res._valueHashes = self._valueHashes[count:size]
+            for topic, positions in self._topicPositions.items():
+                with self._topicLock(topic):
+                    kept = shift(positions)
+                    if (len(kept) == 0):
+                        continue
+                    res._topicPositions[topic] = kept
+                    topicTimes = self._topicTimes[topic]
+                    sliced = _TopicTimes()
+                    for i, position in enumerate(topicTimes.positions):
+                        if (position >= count):
+                            sliced.times.append(topicTimes.times[i])
+                            sliced.initTimes.append(topicTimes.initTimes[i])
+                            sliced.positions.append(position - count)
+                    # The bounds of the removed events are kept: they are still valid, only less tight.
+                    sliced.maxDuration = topicTimes.maxDuration
+                    sliced.maxAdvance = topicTimes.maxAdvance
+                    res._topicTimes[topic] = sliced
+                    for key, index in self._valueIndexes.get(topic, {}).items():
+                        slicedIndex = _ValueIndex(index.path)
+                        for number, position in zip(index.numbers, index.numberPositions):
+                            if (position >= count):
+                                slicedIndex.numbers.append(number)
+                                slicedIndex.numberPositions.append(position - count)
+                        for canonical, positions in index.others.items():
+                            kept = shift(positions)
+                            if (len(kept) > 0):
+                                slicedIndex.others[canonical] = kept
+                        res._valueIndexes.setdefault(topic, dict())[key] = slicedIndex
+            for topic in self._valueIndexes:
+                for key, index in self._valueIndexes[topic].items():
+                    res._valueIndexes.setdefault(topic, dict()).setdefault(key, _ValueIndex(index.path))
+            for hash, positions in self._hashPositions.items():
+                kept = shift(positions)
+                if (len(kept) > 0):
+                    res._hashPositions[hash] = kept
+                    res.hashes[hash] = self.hashes[hash]
+            for id, positions in self._idPositions.items():
+                kept = shift(positions)
+                if (len(kept) > 0):
+                    res._idPositions[id] = kept
+            # Rollups and processing statistics cannot subtract events, so they are computed again (without hashing).
+            for event, valueHash in zip(res.events, res._valueHashes):
+                if (not event.topic in res._rollups):
+                    res._rollups[event.topic] = _Rollup(res.rollupNs)
+                    res._processingStats[event.topic] = ProcessingStats(
+                        res.statsWindow)
+                res._rollups[event.topic].add(
+                    event.time, event.initTime, valueHash)
+                res._processingStats[event.topic].add(event)
+            res._sequence = itertools.count(len(res.events))
+            res._published = len(res.events)
+        return res
+
+    def _save(self, event: Event) -> None:
+        """
+        Synchronous body of "addEventAsync".
+        """
         deepCopy = copy.deepcopy(event)
-        self.hashes[await self.hashAsync(deepCopy)] = deepCopy
-        self.events.append(deepCopy)
+        valueHash = self._hash(deepCopy.value)
+        sequence = next(self._sequence)
+        self._pending[sequence] = (deepCopy, valueHash)
+        self._publish()
+        # The event is visible to reads when this method returns. It only waits when an earlier write is still being published.
+        while (self._published <= sequence):
+            time.sleep(0)
+            self._publish()
+
+    async def addEventAsync(self, event: Event) -> None:
+        self._save(event)
@@ -0,0 +1,174 @@
+from ..core import History, Event, EventHandler
+from typing import Any, List, AsyncIterator
+import asyncio
+import hashlib
+import heapq
+import sys
+
+
+class PartitionedHistory(History):
+    """
+    Shards the events across child Histories by a stable hash of the topic, so that reads and writes of different topics do not contend,
+    and the child Histories can live in separate files or processes. Each write goes only to the shard that owns its topic.
+    Queries fan out concurrently to the shards that may have results, and the results are merged by time (events of the same shard keep the order of the shard).
+    "getEventsAsync" sorts the events of each shard by time before merging them. "iterEventsAsync" streams the shards, so it relies on their insertion order being the order of
+    the times, as when the events are saved as the broker publishes them.
+    All the child Histories must use the same hasher of values.
+    """
+
+    def __init__(self, shards: List[History]):
+        """
+        Constructor:
+        @param shards: (List) Child History instances. The number of shards must not change for the same data, since it decides the owner of each topic.
+        """
+        super().__init__()
+        if (len(shards) == 0):
+            raise Exception('PartitionedHistory needs at least one shard.')
+        self.shards = shards
+
+    def shardOf(self, topic: str) -> int:
+        """
+        @return: Index of the shard that owns a topic. It does not depend on the process (unlike the built-in "hash").
+        """
+        digest = hashlib.blake2b(topic.encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest, 'little') % len(self.shards)
+
+    def _shardsFor(self, filters: dict) -> List[int]:
+        if ('topics' in filters):
+            return sorted(set(self.shardOf(topic) for topic in filters['topics']))
+        return list(range(len(self.shards)))
+
+    def _topicsByShard(self, topics: List[str]) -> dict[int, List[str]]:
+        byShard: dict[int, List[str]] = dict()
+        for topic in set(topics):
+            byShard.setdefault(self.shardOf(topic), []).append(topic)
+        return byShard
+
+    async def addEventAsync(self, event: Event) -> None:
+        await self.shards[self.shardOf(event.topic)].addEventAsync(event)
+
+    async def getEventsAsync(self, filters: dict) -> List[Event]:
+        """
+        Supports the same filters as the child Histories. With 'limit', each shard returns at most 'limit' events.
+        """
+        if ('cursor' in filters):
+            return [event async for event in self.iterEventsAsync(filters)]
+        indexes = self._shardsFor(filters)
+        results = await asyncio.gather(*[self.shards[i].getEventsAsync(filters) for i in indexes])
+        # The shards return their events in insertion order, which may not be the order of the times.
+        merged = heapq.merge(*[sorted((event.time, i, n, event) for n, event in enumerate(result))
+                               for i, result in zip(indexes, results)])
+        res: List[Event] = list()
+        for item in merged:
+            if ('limit' in filters):
+                if (len(res) + 1 > filters['limit']):
+                    break
+            res.append(item[3])
+        return res
+
+    async def iterEventsAsync(self, filters: dict, batchSize: int = 1000) -> AsyncIterator[Event]:
+        """
+        Streams the shards and merges them by time.
+        The 'cursor' is found in all the shards (it does not need to satisfy the other filters): its shard continues after it (with its own 'cursor'),
+        and the other shards skip the events merged before it, that is, with a lower time, or the same time and a lower shard.
+        """
+        shardFilters = {key: filters[key]
+                        for key in filters if not key in ('cursor', 'limit')}
+        indexes = self._shardsFor(filters)
+        cursorShard = None
+        if ('cursor' in filters):
+            found = await asyncio.gather(*[shard.getEventsAsync({'ids': [filters['cursor']]}) for shard in self.shards])
+            for i, events in enumerate(found):
+                if (len(events) > 0):
+                    cursorShard = i
+                    cursorTime = events[0].time
+                    break
+            if (cursorShard is None):
+                return
+        iterators = []
+        for i in indexes:
+            if (i == cursorShard):
+                iterators.append(self.shards[i].iterEventsAsync(
+                    dict(shardFilters, cursor=filters['cursor']), batchSize))
+            else:
+                iterators.append(self.shards[i].iterEventsAsync(
+                    shardFilters, batchSize))
+
+        def afterCursor(n: int, event: Event) -> bool:
+            if (cursorShard is None) or (indexes[n] == cursorShard):
+                return True
+            return (event.time, indexes[n]) > (cursorTime, cursorShard)
+
+        async def first(n: int) -> Event | None:
+            async for event in iterators[n]:
+                if (afterCursor(n, event)):
+                    return event
+            return None
+
+        try:
+            heap = []
+            for n, event in enumerate(await asyncio.gather(*[first(n) for n in range(len(iterators))])):
+                if (event is not None):
+                    heap.append((event.time, n, event))
+            heapq.heapify(heap)
+            count = 0
+            while (len(heap) > 0):
+                if ('limit' in filters):
+                    if (count + 1 > filters['limit']):
+                        break
+                time, n, event = heap[0]
+                following = await first(n)
+                if (following is None):
+                    heapq.heappop(heap)
+                else:
+                    heapq.heapreplace(heap, (following.time, n, following))
+                count += 1
+                yield event
+        finally:
+            # The shards may have been read partially (because of 'limit', or because the caller stopped).
+            for iterator in iterators:
+                if (hasattr(iterator, 'aclose')):
+                    await iterator.aclose()
+
+    async def countOutsAsync(self, handlers: List[EventHandler], minTime: int = 0, maxTime: int = sys.maxsize) -> int:
+        # Each topic is in only one shard, so only the shards that own the published topics are counted, and their counts are added.
+        byShard = self._topicsByShard([topic for h in handlers for topic in h.publishedTopics])
+        counts = await asyncio.gather(*[self.shards[i].countOutsAsync(handlers, minTime, maxTime) for i in byShard])
+        return sum(counts)
+
+    async def aggregateAsync(self, topics: List[str], bucketNs: int, minTime: int = 0, maxTime: int = sys.maxsize) -> dict[str, dict[int, dict]]:
+        History._checkBucket(bucketNs)
+        byShard = self._topicsByShard(topics)
+        res: dict[str, dict[int, dict]] = dict()
+        for result in await asyncio.gather(*[self.shards[i].aggregateAsync(byShard[i], bucketNs, minTime, maxTime) for i in byShard]):
+            res.update(result)
+        return res
+
+    async def stateAtAsync(self, time: int, topics: List[str] = None) -> dict[str, Event]:
+        if (topics is None):
+            byShard = {i: None for i in range(len(self.shards))}
+        else:
+            byShard = self._topicsByShard(topics)
+        res: dict[str, Event] = dict()
+        for result in await asyncio.gather(*[self.shards[i].stateAtAsync(time, byShard[i]) for i in byShard]):
+            res.update(result)
+        return res
+
+    async def processingStatsAsync(self, topic: str, minTime: int = 0, maxTime: int = sys.maxsize) -> dict:
+        return await self.shards[self.shardOf(topic)].processingStatsAsync(topic, minTime, maxTime)
+
+    async def hashAsync(self, obj: Any) -> str:
+        # The value is registered in all the shards, since "objByHashAsync" does not know the topic.
+        hashes = await asyncio.gather(*[shard.hashAsync(obj) for shard in self.shards])
+        return hashes[0]
+
+    async def objByHashAsync(self, hash: str) -> Any:
+        for shard in self.shards:
+            try:
+                return await shard.objByHashAsync(hash)
+            except Exception:
+                continue
+        raise Exception(f'Hash {hash} not found in history.')
+
+    async def flushAsync(self) -> None:
+        await asyncio.gather(*[shard.flushAsync() for shard in self.shards])
@@ -0,0 +1,191 @@
+from ..core import History, Event, EventHandler
+from ..hashing import Hasher, JSONHasher
+import copy
+from typing import Any, List, AsyncIterator
+from array import array
+import bisect
+import heapq
+import sys
+import threading
+
+
+class _Run:
+    """
+    Consecutive events of a topic with the same value. The value is saved once. Times are kept in compact arrays, so queries by time remain exact.
+    """
+
+    def __init__(self, valueHash: str, value: Any):
+        self.valueHash = valueHash
+        self.value = value
+        self.count = 0
+        self.firstTime = 0
+        self.lastTime = 0
+        self.minTime = sys.maxsize
+        self.maxTime = -sys.maxsize
+        self.minInitTime = sys.maxsize
+        self.maxInitTime = -sys.maxsize
+        self.times = array('q')
+        self.initTimes = array('q')
+        # Position of each event in the order of the writes.
+        self.sequences = array('q')
+
+    def add(self, sequence: int, time: int, initTime: int) -> None:
+        if (self.count == 0):
+            self.firstTime = time
+        self.lastTime = time
+        self.minTime = min(self.minTime, time)
+        self.maxTime = max(self.maxTime, time)
+        self.minInitTime = min(self.minInitTime, initTime)
+        self.maxInitTime = max(self.maxInitTime, initTime)
+        self.times.append(time)
+        self.initTimes.append(initTime)
+        # Appended last: readers only look at the positions that already have a sequence.
+        self.sequences.append(sequence)
+        self.count += 1
+
+    def mayContain(self, filters: dict) -> bool:
+        if ('valuesHashes' in filters):
+            if (not self.valueHash in filters['valuesHashes']):
+                return False
+        if ('minTime' in filters):
+            if (self.maxInitTime < filters['minTime']):
+                return False
+        if ('maxTime' in filters):
+            if (self.minTime > filters['maxTime']):
+                return False
+        if ('valueWhere' in filters):
+            # All the events of a run have the same value.
+            if (not History._satisfiesValueWhere(self.value, filters['valueWhere'])):
+                return False
+        return True
+
+    def within(self, minTime: int, maxTime: int) -> bool:
+        return (self.minInitTime >= minTime) and (self.maxTime <= maxTime)
+
+
+class RunLengthHistory(History):
+    """
+    A History that compacts runs of equal consecutive values on a topic (for example, beliefs republished every cycle with the same value).
+    Each run is saved as one record with the value, first/last time and count, plus compact arrays with the times of its events.
+    Queries and counts return the same events as an InMemoryHistory (so results are equivalent for the explainers).
+    The ids of the events are kept in a list by position in the order of the writes, since they are unique and cannot be compacted.
+    """
+
+    def __init__(self, hasher: Hasher = None):
+        """
+        Constructor:
+        @param hasher: (optional) Hasher of the event values. Default: JSONHasher.
+        """
+        super().__init__()
+        if (hasher is None):
+            hasher = JSONHasher()
+        self.hasher = hasher
+        self.runs: dict[str, list[_Run]] = dict()
+        self.hashes: dict[str, Any] = dict()
+        # Id of each event, by its position in the order of the writes, and the first position of each id.
+        self._ids: list[str] = []
+        self._sequenceById: dict[str, int] = dict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    async def addEventAsync(self, event: Event) -> None:
+        valueHash = await self.hashAsync(copy.deepcopy(event.value))
+        with self._lock:
+            if (not event.topic in self.runs):
+                self.runs[event.topic] = []
+            runs = self.runs[event.topic]
+            if (len(runs) == 0) or (runs[-1].valueHash != valueHash):
+                runs.append(_Run(valueHash, self.hashes[valueHash]))
+            self._ids.append(event.id)
+            self._sequenceById.setdefault(event.id, self._size)
+            runs[-1].add(self._size, event.time, event.initTime)
+            self._size += 1
+
+    def _topicEvents(self, topic: str, filters: dict, start: int, size: int):
+        """
+        Events of a topic that satisfy the filters, in the order of the writes.
+        @return: A generator of tuples (sequence, Event).
+        """
+        for run in list(self.runs[topic]):
+            if (not run.mayContain(filters)):
+                continue
+            for index in range(bisect.bisect_left(run.sequences, start), len(run.sequences)):
+                sequence = run.sequences[index]
+                if (sequence >= size):
+                    return
+                time = run.times[index]
+                initTime = run.initTimes[index]
+                if ('minTime' in filters) and (initTime < filters['minTime']):
+                    continue
+                if ('maxTime' in filters) and (time > filters['maxTime']):
+                    continue
+                if ('times' in filters) and (not time in filters['times']):
+                    continue
+                if ('ids' in filters) and (not self._ids[sequence] in filters['ids']):
+                    continue
+                yield sequence, Event(topic=topic, value=run.value, time=time, initTime=initTime, id=self._ids[sequence])
+
+    async def getEventsAsync(self, filters: dict) -> List[Event]:
+        """
+        Supports all the recommended filters ('ids', 'topics', 'times', 'valuesHashes', 'valueWhere', 'minTime', 'maxTime', 'limit' and 'cursor').
+        """
+        return [event async for event in self.iterEventsAsync(filters)]
+
+    async def iterEventsAsync(self, filters: dict, batchSize: int = 1000) -> AsyncIterator[Event]:
+        """
+        Merges the runs of the topics in the order of the writes. "batchSize" is not used.
+        """
+        # Events saved during the iteration are not returned.
+        size = self._size
+        start = 0
+        if ('cursor' in filters):
+            if (not filters['cursor'] in self._sequenceById):
+                return
+            start = self._sequenceById[filters['cursor']] + 1
+            if (start > size):
+                return
+        if ('ids' in filters):
+            filters = dict(filters, ids=set(filters['ids']))
+        topics = list(self.runs)
+        if ('topics' in filters):
+            topics = [t for t in filters['topics'] if t in self.runs]
+        count = 0
+        for sequence, event in heapq.merge(*[self._topicEvents(topic, filters, start, size) for topic in topics], key=lambda item: item[0]):
+            if ('limit' in filters):
+                if (count + 1 > filters['limit']):
+                    break
+            count += 1
+            yield event
+
+    async def countOutsAsync(self, handlers: List[EventHandler], minTime: int = 0, maxTime: int = sys.maxsize) -> int:
+        topics: set[str] = set()
+        for h in handlers:
+            for topic in h.publishedTopics:
+                topics.add(topic)
+        count = 0
+        filters = {'minTime': minTime, 'maxTime': maxTime}
+        for topic in topics:
+            if (not topic in self.runs):
+                continue
+            for run in list(self.runs[topic]):
+                if (not run.mayContain(filters)):
+                    continue
+                if (run.within(minTime, maxTime)):
+                    count += len(run.sequences)
+                    continue
+                for index in range(len(run.sequences)):
+                    if (run.initTimes[index] >= minTime) and (run.times[index] <= maxTime):
+                        count += 1
+        return count
+
+    async def hashAsync(self, obj: Any) -> str:
+        hash = self.hasher.hash(obj)
+        if (not hash in self.hashes):
+            self.hashes[hash] = obj
+        return hash
+
+    async def objByHashAsync(self, hash: str) -> Any:
+        if (hash in self.hashes):
+            return self.hashes[hash]
+        else:
+            raise Exception(f'Hash {hash} not found in history.')
@@ -0,0 +1,402 @@
+from ..core import History, Event, EventHandler, CoreJSONEncoder
+from typing import Any, List, AsyncIterator
+from ..hashing import Hasher, JSONHasher
+import os
+import sys
+import json
+import mmap
+import struct
+import threading
+
+# Event record: length of the rest of the record, time, initTime, topic length, id length, followed by topic, id and the JSON of the value.
+_EVENT_HEADER = struct.Struct('<IqqHH')
+# Value record: length of the rest of the record, hash length, followed by hash and the JSON of the value.
+_VALUE_HEADER = struct.Struct('<IH')
+_LENGTH = struct.Struct('<I')
+
+
+class _Block:
+    """
+    Sparse index entry. Summarizes a run of consecutive records of a segment, so that a query can skip it without reading it.
+    """
+
+    def __init__(self, offset: int):
+        self.offset = offset
+        self.end = offset
+        self.count = 0
+        self.minTime = sys.maxsize
+        self.maxTime = -sys.maxsize
+        self.minInitTime = sys.maxsize
+        self.maxInitTime = -sys.maxsize
+        self.latest: dict[str, tuple[int, int]] = dict()
+
+    def add(self, time: int, initTime: int, topic: str, offset: int, end: int) -> None:
+        # Checkpoint used by "stateAtAsync": the latest record of each topic, as (time, offset). On equal times, the last written one.
+        if (not topic in self.latest) or (time >= self.latest[topic][0]):
+            self.latest[topic] = (time, offset)
+        self.end = end
+        self.count += 1
+        self.minTime = min(self.minTime, time)
+        self.maxTime = max(self.maxTime, time)
+        self.minInitTime = min(self.minInitTime, initTime)
+        self.maxInitTime = max(self.maxInitTime, initTime)
+
+    def mayContain(self, filters: dict) -> bool:
+        """
+        Uses the summary to decide if the block can contain events that satisfy the time filters.
+        """
+        if (self.count == 0):
+            return False
+        if ('minTime' in filters):
+            if (self.maxInitTime < filters['minTime']):
+                return False
+        if ('maxTime' in filters):
+            if (self.minTime > filters['maxTime']):
+                return False
+        if ('times' in filters):
+            if (not any(self.minTime <= t <= self.maxTime for t in filters['times'])):
+                return False
+        return True
+
+
+class _Segment:
+    """
+    A segment file of the log, with its sparse index and the topics it contains.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.size = 0
+        self.topics: set[str] = set()
+        self.blocks: list[_Block] = []
+        self.summary = _Block(0)
+        self._map = None
+        self._mapSize = 0
+
+    def add(self, time: int, initTime: int, topic: str, offset: int, end: int, indexInterval: int) -> None:
+        if ((len(self.blocks) == 0) or (self.blocks[-1].count >= indexInterval)):
+            self.blocks.append(_Block(offset))
+        self.blocks[-1].add(time, initTime, topic, offset, end)
+        self.summary.add(time, initTime, topic, offset, end)
+        self.topics.add(topic)
+        self.size = end
+
+    def mayContain(self, filters: dict) -> bool:
+        if ('topics' in filters):
+            if (self.topics.isdisjoint(filters['topics'])):
+                return False
+        return self.summary.mayContain(filters)
+
+    def mapped(self) -> mmap.mmap:
+        """
+        Memory-maps the segment. The map is renewed only when the segment has grown since the last mapping.
+        """
+        if (self._map is None) or (self._mapSize < self.size):
+            with open(self.path, 'rb') as file:
+                self._map = mmap.mmap(
+                    file.fileno(), self.size, access=mmap.ACCESS_READ)
+            self._mapSize = self.size
+        return self._map
+
+
+class SegmentedLogHistory(History):
+    """
+    A History that appends events to rolling segment files on disk. Useful for very high event rates.
+    Each event is a length-prefixed record. Each segment keeps a sparse index (blocks of records with their time ranges) and the set of its topics.
+    Reads are done through "mmap", and queries by 'topics', 'times', 'minTime' and 'maxTime' only touch the segments and blocks that can contain results.
+    Values are saved as JSON, so they are recovered as JSON-decoded data.
+    """
+
+    def __init__(self, path: str, segmentSize: int = 64 * 1024 * 1024, indexInterval: int = 256, hasher: Hasher = None):
+        """
+        Constructor:
+        @param path: Directory where the segments are saved. Existing segments are reopened.
+        @param segmentSize: Size (in bytes) from which the active segment is closed and a new one is started.
+        @param indexInterval: Number of records summarized by each entry of the sparse index.
+        @param hasher: (optional) Hasher of the event values. Default: JSONHasher.
+        """
+        super().__init__()
+        if (hasher is None):
+            hasher = JSONHasher()
+        self.hasher = hasher
+        self.path = path
+        self.segmentSize = segmentSize
+        self.indexInterval = indexInterval
+        self._lock = threading.RLock()
+        self._segments: list[_Segment] = []
+        self._valueOffsets: dict[str, int] = dict()
+        self._valuesMap = None
+        self._valuesMapSize = 0
+        os.makedirs(path, exist_ok=True)
+        for name in sorted(os.listdir(path)):
+            if (name.startswith('segment-') and name.endswith('.log')):
+                self._segments.append(
+                    self._recoverSegment(os.path.join(path, name)))
+        if (len(self._segments) == 0):
+            self._segments.append(_Segment(self._segmentPath(0)))
+        self._writer = open(self._segments[-1].path, 'ab')
+        self._valuesPath = os.path.join(path, 'values.log')
+        self._valuesSize = self._recoverValues()
+        self._valuesWriter = open(self._valuesPath, 'ab')
+
+    def _segmentPath(self, number: int) -> str:
+        return os.path.join(self.path, 'segment-%012d.log' % number)
+
+    def _recoverSegment(self, path: str) -> _Segment:
+        """
+        Rebuilds the sparse index of a segment when the history is reopened.
+        """
+        segment = _Segment(path)
+        data = self._readAll(path)
+        offset = 0
+        while (offset + _EVENT_HEADER.size <= len(data)):
+            length, time, initTime, topicLen, idLen = _EVENT_HEADER.unpack_from(
+                data, offset)
+            end = offset + _LENGTH.size + length
+            if (end > len(data)):
+                break
+            start = offset + _EVENT_HEADER.size
+            topic = data[start:start + topicLen].decode('utf-8')
+            segment.add(time, initTime, topic, offset,
+                        end, self.indexInterval)
+            offset = end
+        self._truncate(path, data, offset)
+        segment.size = offset
+        return segment
+
+    def _recoverValues(self) -> int:
+        if (not os.path.exists(self._valuesPath)):
+            return 0
+        data = self._readAll(self._valuesPath)
+        offset = 0
+        while (offset + _VALUE_HEADER.size <= len(data)):
+            length, hashLen = _VALUE_HEADER.unpack_from(data, offset)
+            end = offset + _LENGTH.size + length
+            if (end > len(data)):
+                break
+            start = offset + _VALUE_HEADER.size
+            self._valueOffsets[data[start:start +
+                                    hashLen].decode('utf-8')] = offset
+            offset = end
+        self._truncate(self._valuesPath, data, offset)
+        return offset
+
+    def _readAll(self, path: str) -> mmap.mmap | bytes:
+        with open(path, 'rb') as file:
+            if (os.fstat(file.fileno()).st_size == 0):
+                return b''
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _truncate(self, path: str, data: mmap.mmap | bytes, size: int) -> None:
+        """
+        Discards a partial record at the end of a file (interrupted write).
+        """
+        length = len(data)
+        if (isinstance(data, mmap.mmap)):
+            data.close()
+        if (size < length):
+            with open(path, 'r+b') as file:
+                file.truncate(size)
+
+    def _encodeValue(self, value: Any) -> bytes:
+        return CoreJSONEncoder(separators=(',', ':')).encode(value).encode('utf-8')
+
+    def _roll(self) -> None:
+        """
+        Closes the active segment and starts a new one.
+        """
+        self._writer.close()
+        self._segments.append(
+            _Segment(self._segmentPath(len(self._segments))))
+        self._writer = open(self._segments[-1].path, 'ab')
+
+    async def addEventAsync(self, event: Event) -> None:
+        topic = event.topic.encode('utf-8')
+        id = event.id.encode('utf-8')
+        value = self._encodeValue(event.value)
+        length = _EVENT_HEADER.size - _LENGTH.size + \
+            len(topic) + len(id) + len(value)
+        record = _EVENT_HEADER.pack(length, event.time, event.initTime, len(
+            topic), len(id)) + topic + id + value
+        with self._lock:
+            segment = self._segments[-1]
+            if (segment.size > 0) and (segment.size + len(record) > self.segmentSize):
+                self._roll()
+                segment = self._segments[-1]
+            self._writer.write(record)
+            segment.add(event.time, event.initTime, event.topic, segment.size,
+                        segment.size + len(record), self.indexInterval)
+
+    def _snapshot(self) -> list[tuple[_Segment, mmap.mmap]]:
+        """
+        Makes the pending writes visible and returns the mapped segments that can be read.
+        """
+        with self._lock:
+            self._writer.flush()
+            return [(segment, segment.mapped()) for segment in self._segments if segment.size > 0]
+
+    def _records(self, filters: dict):
+        """
+        Iterates, in storage order, over the records whose header satisfies the filters, applying the 'cursor'.
+        Blocks are only skipped after the cursor has been found, since the cursor may be in any block.
+        @return: A generator of tuples (time, initTime, topic, id, mapped segment, start of value, end of record).
+        """
+        cursor = not ('cursor' in filters)
+        cursorId = filters['cursor'].encode('utf-8') if not cursor else None
+        for segment, data in self._snapshot():
+            if (cursor and (not segment.mayContain(filters))):
+                continue
+            for block in list(segment.blocks):
+                if (cursor and (not block.mayContain(filters))):
+                    continue
+                offset = block.offset
+                # The last block may have grown after the segment was mapped.
+                end = min(block.end, len(data))
+                while (offset < end):
+                    length, time, initTime, topicLen, idLen = _EVENT_HEADER.unpack_from(
+                        data, offset)
+                    recordEnd = offset + _LENGTH.size + length
+                    topicStart = offset + _EVENT_HEADER.size
+                    idStart = topicStart + topicLen
+                    valueStart = idStart + idLen
+                    if (not cursor):
+                        if (data[idStart:valueStart] == cursorId):
+                            cursor = True
+                        offset = recordEnd
+                        continue
+                    offset = recordEnd
+                    if ('minTime' in filters) and (initTime < filters['minTime']):
+                        continue
+                    if ('maxTime' in filters) and (time > filters['maxTime']):
+                        continue
+                    if ('times' in filters) and (not time in filters['times']):
+                        continue
+                    topic = data[topicStart:idStart].decode('utf-8')
+                    if ('topics' in filters) and (not topic in filters['topics']):
+                        continue
+                    id = data[idStart:valueStart].decode('utf-8')
+                    if ('ids' in filters) and (not id in filters['ids']):
+                        continue
+                    yield time, initTime, topic, id, data, valueStart, recordEnd
+
+    async def getEventsAsync(self, filters: dict) -> List[Event]:
+        """
+        Supports all the recommended filters ('ids', 'topics', 'times', 'valuesHashes', 'valueWhere', 'minTime', 'maxTime', 'limit' and 'cursor').
+        """
+        return [event async for event in self.iterEventsAsync(filters)]
+
+    async def iterEventsAsync(self, filters: dict, batchSize: int = 1000) -> AsyncIterator[Event]:
+        """
+        Streams the records directly from the mapped segments. "batchSize" is not used.
+        """
+        count = 0
+        for time, initTime, topic, id, data, valueStart, end in self._records(filters):
+            if ('limit' in filters):
+                if (count + 1 > filters['limit']):
+                    break
+            event = Event(topic=topic, value=json.loads(
+                data[valueStart:end]), time=time, initTime=initTime, id=id)
+            if ('valuesHashes' in filters):
+                if (not (await self.hashAsync(event.value)) in filters['valuesHashes']):
+                    continue
+            if ('valueWhere' in filters):
+                if (not History._satisfiesValueWhere(event.value, filters['valueWhere'])):
+                    continue
+            count += 1
+            yield event
+
+    async def countOutsAsync(self, handlers: List[EventHandler], minTime: int = 0, maxTime: int = sys.maxsize) -> int:
+        topics: set[str] = set()
+        for h in handlers:
+            for topic in h.publishedTopics:
+                topics.add(topic)
+        count = 0
+        for record in self._records({'topics': topics, 'minTime': minTime, 'maxTime': maxTime}):
+            count += 1
+        return count
+
+    async def stateAtAsync(self, time: int, topics: List[str] = None) -> dict[str, Event]:
+        """
+        Uses the checkpoints of the segments and blocks (latest record of each topic): segments and blocks that end before the instant are resolved from them,
+        and only the records of the blocks that contain the instant (the deltas) are read.
+        """
+        if (topics is not None):
+            topics = set(topics)
+        latest: dict[str, tuple[int, int, int, mmap.mmap]] = dict()
+
+        def consider(topic: str, recordTime: int, number: int, offset: int, data: mmap.mmap) -> None:
+            if ((topics is None) or (topic in topics)) and ((not topic in latest) or ((recordTime, number, offset) >= latest[topic][:3])):
+                latest[topic] = (recordTime, number, offset, data)
+
+        for number, (segment, data) in enumerate(self._snapshot()):
+            if (segment.summary.minTime > time):
+                continue
+            summary = segment.summary
+            blocks = [summary] if (summary.maxTime <= time) and (summary.end <= len(data)) else list(
+                segment.blocks)
+            for block in blocks:
+                if (block.count == 0) or (block.minTime > time):
+                    continue
+                # The last block may have grown after the segment was mapped. Then its checkpoint can refer to records that are not mapped.
+                if (block.maxTime <= time) and (block.end <= len(data)):
+                    for topic, (recordTime, offset) in list(block.latest.items()):
+                        consider(topic, recordTime, number, offset, data)
+                    continue
+                offset = block.offset
+                end = min(block.end, len(data))
+                while (offset < end):
+                    length, recordTime, initTime, topicLen, idLen = _EVENT_HEADER.unpack_from(
+                        data, offset)
+                    if (recordTime <= time):
+                        start = offset + _EVENT_HEADER.size
+                        consider(data[start:start + topicLen].decode('utf-8'),
+                                 recordTime, number, offset, data)
+                    offset += _LENGTH.size + length
+        res: dict[str, Event] = dict()
+        for topic in latest:
+            recordTime, number, offset, data = latest[topic]
+            length, recordTime, initTime, topicLen, idLen = _EVENT_HEADER.unpack_from(
+                data, offset)
+            idStart = offset + _EVENT_HEADER.size + topicLen
+            valueStart = idStart + idLen
+            res[topic] = Event(topic=topic, value=json.loads(data[valueStart:offset + _LENGTH.size + length]),
+                               time=recordTime, initTime=initTime, id=data[idStart:valueStart].decode('utf-8'))
+        return res
+
+    async def hashAsync(self, obj: Any) -> str:
+        hash = self.hasher.hash(obj)
+        if (not hash in self._valueOffsets):
+            encodedHash = hash.encode('utf-8')
+            value = self._encodeValue(obj)
+            length = _VALUE_HEADER.size - _LENGTH.size + \
+                len(encodedHash) + len(value)
+            with self._lock:
+                if (not hash in self._valueOffsets):
+                    self._valuesWriter.write(_VALUE_HEADER.pack(
+                        length, len(encodedHash)) + encodedHash + value)
+                    self._valueOffsets[hash] = self._valuesSize
+                    self._valuesSize += _LENGTH.size + length
+        return hash
+
+    async def objByHashAsync(self, hash: str) -> Any:
+        if (not hash in self._valueOffsets):
+            raise Exception(f'Hash {hash} not found in history.')
+        offset = self._valueOffsets[hash]
+        with self._lock:
+            self._valuesWriter.flush()
+            if (self._valuesMap is None) or (self._valuesMapSize < self._valuesSize):
+                with open(self._valuesPath, 'rb') as file:
+                    self._valuesMap = mmap.mmap(
+                        file.fileno(), self._valuesSize, access=mmap.ACCESS_READ)
+                self._valuesMapSize = self._valuesSize
+            data = self._valuesMap
+        length, hashLen = _VALUE_HEADER.unpack_from(data, offset)
+        return json.loads(data[offset + _VALUE_HEADER.size + hashLen:offset + _LENGTH.size + length])
+
+    def close(self) -> None:
+        """
+        Closes the files of the active segment and of the values.
+        """
+        with self._lock:
+            self._writer.close()
+            self._valuesWriter.close()
@@ -0,0 +1,240 @@
+from ..core import History, Event, EventHandler, CoreJSONEncoder
+from .in_memory import InMemoryHistory
+from ..hashing import Hasher
+from typing import Any, List, AsyncIterator
+from collections import OrderedDict
+import os
+import sys
+import json
+import zlib
+import threading
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class _ColdSegment:
+    """
+    A compressed file with events moved out of the hot tier, with a summary used to skip it in queries.
+    Each line also has the hash of the value of the event, so that values can be found by their hashes.
+    """
+
+    def __init__(self, path: str, compression: str, events: List[Event], valueHashes: List[str]):
+        self.path = path
+        self.compression = compression
+        self.count = len(events)
+        self.minTime = min(e.time for e in events)
+        self.maxTime = max(e.time for e in events)
+        self.minInitTime = min(e.initTime for e in events)
+        self.maxInitTime = max(e.initTime for e in events)
+        self.topicCounts: dict[str, int] = dict()
+        for e in events:
+            self.topicCounts[e.topic] = self.topicCounts.get(e.topic, 0) + 1
+        encoder = CoreJSONEncoder(separators=(',', ':'))
+        data = '\n'.join(encoder.encode(dict(e, valueHash=valueHash))
+                         for e, valueHash in zip(events, valueHashes)).encode('utf-8')
+        if (compression == 'zstd'):
+            data = zstandard.ZstdCompressor().compress(data)
+        else:
+            data = zlib.compress(data)
+        with open(path, 'wb') as file:
+            file.write(data)
+
+    def mayContain(self, filters: dict) -> bool:
+        if ('topics' in filters):
+            if (not any(topic in self.topicCounts for topic in filters['topics'])):
+                return False
+        if ('minTime' in filters):
+            if (self.maxInitTime < filters['minTime']):
+                return False
+        if ('maxTime' in filters):
+            if (self.minTime > filters['maxTime']):
+                return False
+        if ('times' in filters):
+            if (not any(self.minTime <= t <= self.maxTime for t in filters['times'])):
+                return False
+        return True
+
+    def _lines(self) -> List[dict]:
+        with open(self.path, 'rb') as file:
+            data = file.read()
+        if (self.compression == 'zstd'):
+            data = zstandard.ZstdDecompressor().decompress(data)
+        else:
+            data = zlib.decompress(data)
+        return [json.loads(line) for line in data.decode('utf-8').split('\n')]
+
+    def read(self) -> List[Event]:
+        events = list()
+        for d in self._lines():
+            events.append(Event(topic=d['topic'], value=d['value'],
+                          time=d['time'], initTime=d['initTime'], id=d['id']))
+        return events
+
+    def findValue(self, hash: str) -> tuple[bool, Any]:
+        """
+        @return: (True, value) if an event of the segment has a value with the given hash, otherwise (False, None).
+        """
+        for d in self._lines():
+            if (d['valueHash'] == hash):
+                return True, d['value']
+        return False, None
+
+
+class TieredHistory(History):
+    """
+    A History with two tiers. Recent events are kept in an indexed hot tier in RAM (an InMemoryHistory).
+    Older events are moved automatically, in chunks, to compressed segments on disk (cold tier), that can still be queried.
+    Queries fan out transparently over both tiers (cold segments first, in the order they were written, then the hot tier), skipping the segments that cannot contain results.
+    Values of the cold tier are saved as JSON, so they are recovered as JSON-decoded data.
+    Only the hashes of the hot tier, and the latest "hashCacheSize" objects hashed or found, are kept in RAM. Other values are found by their hashes in the cold segments.
+    """
+
+    def __init__(self, path: str, hotMaxEvents: int = 100000, segmentEvents: int = 0, hotMaxAge: int = 0, compression: str = 'zlib', hasher: Hasher = None,
+                 hashCacheSize: int = 4096):
+        """
+        Constructor:
+        @param path: Directory where the cold segments are saved. Cold segments belong to this instance, and are not reopened.
+        @param hotMaxEvents: Maximum number of events in the hot tier.
+        @param segmentEvents: Number of events moved to each cold segment. Default: half of "hotMaxEvents".
+        @param hotMaxAge: (optional) Events older than this (in nanoseconds, relative to the most recent event) are also moved to the cold tier, once there are "segmentEvents" of them.
+        @param compression: 'zlib' or 'zstd' (requires the optional dependency "zstandard").
+        @param hasher: (optional) Hasher of the event values. Default: JSONHasher.
+        @param hashCacheSize: Number of objects kept (besides the values of the hot tier) to find them by their hashes without reading the cold segments.
+        """
+        super().__init__()
+        if (compression == 'zstd') and (zstandard is None):
+            raise Exception(
+                'The "zstd" compression requires the "zstandard" package.')
+        self.path = path
+        self.hotMaxEvents = hotMaxEvents
+        self.segmentEvents = segmentEvents or max(hotMaxEvents // 2, 1)
+        self.hotMaxAge = hotMaxAge
+        self.compression = compression
+        self.hot = InMemoryHistory(hasher)
+        self.hasher = self.hot.hasher
+        self.cold: list[_ColdSegment] = []
+        self.hashCacheSize = hashCacheSize
+        # Latest objects hashed or found in the cold segments (LRU).
+        self._hashCache: OrderedDict[str, Any] = OrderedDict()
+        self._lastTime = 0
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def _demote(self) -> None:
+        """
+        Moves the oldest events of the hot tier to a new cold segment. The hot tier is replaced by a slice of itself, so that running queries keep the previous one.
+        """
+        events = self.hot.events
+        count = self.segmentEvents
+        if (len(events) <= self.hotMaxEvents):
+            if (self.hotMaxAge <= 0) or (len(events) < count):
+                return
+            # Events are saved roughly in time order, so it is enough to check the last event of the chunk.
+            if (events[count - 1].time >= self._lastTime - self.hotMaxAge):
+                return
+        extension = '.zst' if self.compression == 'zstd' else '.zlib'
+        segment = _ColdSegment(os.path.join(self.path, 'cold-%012d%s' % (len(self.cold), extension)),
+                               self.compression, events[:count], self.hot._valueHashes[:count])
+        hot = self.hot._withoutOldest(count)
+        self.cold.append(segment)
+        self.hot = hot
+
+    async def addEventAsync(self, event: Event) -> None:
+        # The writes of the hot tier are synchronous, so the lock is not held across an await.
+        with self._lock:
+            self.hot._save(event)
+            self._lastTime = max(self._lastTime, event.time)
+            self._demote()
+
+    async def getEventsAsync(self, filters: dict) -> List[Event]:
+        """
+        Supports all the recommended filters ('ids', 'topics', 'times', 'valuesHashes', 'valueWhere', 'minTime', 'maxTime', 'limit' and 'cursor').
+        """
+        return [event async for event in self.iterEventsAsync(filters)]
+
+    async def iterEventsAsync(self, filters: dict, batchSize: int = 1000) -> AsyncIterator[Event]:
+        """
+        Streams the cold segments one by one, then the hot tier. "batchSize" is not used.
+        """
+        with self._lock:
+            cold = list(self.cold)
+            hot = self.hot
+        cursor = not ('cursor' in filters)
+        count = 0
+        for segment in cold:
+            # The cursor may be in any segment.
+            if (cursor and (not segment.mayContain(filters))):
+                continue
+            for event in segment.read():
+                if (not cursor):
+                    cursor = event.id == filters['cursor']
+                    continue
+                if ('limit' in filters):
+                    if (count + 1 > filters['limit']):
+                        return
+                if (await self._satisfiesFiltersAsync(event, filters)):
+                    count += 1
+                    yield event
+        hotFilters = dict(filters)
+        if (cursor):
+            hotFilters.pop('cursor', None)
+        if ('limit' in filters):
+            hotFilters['limit'] = filters['limit'] - count
+        async for event in hot.iterEventsAsync(hotFilters, batchSize):
+            yield event
+
+    async def countOutsAsync(self, handlers: List[EventHandler], minTime: int = 0, maxTime: int = sys.maxsize) -> int:
+        topics: set[str] = set()
+        for h in handlers:
+            for topic in h.publishedTopics:
+                topics.add(topic)
+        with self._lock:
+            cold = list(self.cold)
+            hot = self.hot
+        filters = {'topics': topics, 'minTime': minTime, 'maxTime': maxTime}
+        count = await hot.countOutsAsync(handlers, minTime, maxTime)
+        for segment in cold:
+            if (not segment.mayContain(filters)):
+                continue
+            if (segment.minInitTime >= minTime) and (segment.maxTime <= maxTime):
+                # The whole segment is in the time range, so the summary is enough.
+                for topic in topics:
+                    count += segment.topicCounts.get(topic, 0)
+                continue
+            for event in segment.read():
+                if (await self._satisfiesFiltersAsync(event, filters)):
+                    count += 1
+        return count
+
+    def _cache(self, hash: str, obj: Any) -> None:
+        with self._lock:
+            self._hashCache[hash] = obj
+            self._hashCache.move_to_end(hash)
+            while (len(self._hashCache) > self.hashCacheSize):
+                self._hashCache.popitem(last=False)
+
+    async def hashAsync(self, obj: Any) -> str:
+        hash = self.hasher.hash(obj)
+        self._cache(hash, obj)
+        return hash
+
+    async def objByHashAsync(self, hash: str) -> Any:
+        """
+        Looks for the hash in the hot tier, then in the cache, then in the cold segments (from the newest).
+        """
+        with self._lock:
+            cold = list(self.cold)
+            hot = self.hot
+            if (hash in hot.hashes):
+                return hot.hashes[hash]
+            if (hash in self._hashCache):
+                self._hashCache.move_to_end(hash)
+                return self._hashCache[hash]
+        for segment in reversed(cold):
+            found, value = segment.findValue(hash)
+            if (found):
+                self._cache(hash, value)
+                return value
+        raise Exception(f'Hash {hash} not found in history.')
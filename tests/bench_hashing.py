@@ -0,0 +1,26 @@
+from src.goalEDP.hashing import DeepHasher, JSONHasher
+
+import random
+import timeit
+
+
+# Compares the value hashers on payloads like the "accident" events of the sample application.
+# Run from the repository root: python -m tests.bench_hashing
+
+def accident():
+    return {"victims": [{"mmHg": [random.randint(5, 20), random.randint(5, 20)], "bpm": random.randint(40, 120)} for _ in range(random.randint(1, 5))],
+            "coord": [random.randint(0, 100), random.randint(0, 100)],
+            "smoke": random.randint(0, 100)}
+
+
+random.seed(0)
+# Distinct payloads (cache misses) and repeated payloads (as beliefs republished every cycle).
+distinct = [accident() for _ in range(2000)]
+repeated = [distinct[i % 20] for i in range(2000)]
+scalars = [random.random() < 0.5 for _ in range(2000)]
+
+for name, values in [("distinct accidents", distinct), ("repeated accidents", repeated), ("booleans", scalars)]:
+    for hasher in [DeepHasher(), JSONHasher()]:
+        seconds = min(timeit.repeat(lambda: [hasher.hash(v)
+                      for v in values], number=1, repeat=5))
+        print(f"{name:<20} {type(hasher).__name__:<12} {seconds * 1e6 / len(values):10.2f} us/value")
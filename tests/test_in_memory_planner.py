@@ -0,0 +1,111 @@
+import asyncio
+import itertools
+import random
+from src.goalEDP.storages.in_memory import InMemoryHistory
+from src.goalEDP.core import Event, History
+
+
+# The planned queries of InMemoryHistory (see "explain") must return the same events as a linear scan of the events.
+# Run from the repository root: python -m pytest tests/test_in_memory_planner.py
+
+def history():
+    indexed = InMemoryHistory()
+    indexed.createValueIndex("goal", "level")
+    indexed.createValueIndex("belief", "level")
+    rng = random.Random(7)
+    for i in range(300):
+        topic = ["goal", "belief", "desire"][rng.randrange(3)]
+        time = rng.randrange(1, 60)
+        # Some events take time to be processed, so "initTime" < "time".
+        initTime = time - rng.choice([0, 0, 1, 5])
+        indexed.addEvent(Event(topic, {"level": rng.randrange(5)}, time=time, initTime=initTime))
+    return indexed
+
+
+def linear(indexed, filters):
+    events = indexed.events
+    start = 0
+    if ("cursor" in filters):
+        positions = [n for n, e in enumerate(events) if e.id == filters["cursor"]]
+        if (len(positions) == 0):
+            return []
+        start = positions[0] + 1
+    res = []
+    for e in events[start:]:
+        if ("limit" in filters) and (len(res) == filters["limit"]):
+            break
+        if ("ids" in filters) and (not e.id in filters["ids"]):
+            continue
+        if ("topics" in filters) and (not e.topic in filters["topics"]):
+            continue
+        if ("times" in filters) and (not e.time in filters["times"]):
+            continue
+        if ("valuesHashes" in filters) and (not asyncio.run(indexed.hashAsync(e.value)) in filters["valuesHashes"]):
+            continue
+        if ("minTime" in filters) and (e.initTime < filters["minTime"]):
+            continue
+        if ("maxTime" in filters) and (e.time > filters["maxTime"]):
+            continue
+        if ("valueWhere" in filters) and (not History._satisfiesValueWhere(e.value, filters["valueWhere"])):
+            continue
+        res.append(e)
+    return res
+
+
+def options(indexed):
+    rng = random.Random(11)
+    ids = [e.id for e in indexed.events]
+    hashes = [asyncio.run(indexed.hashAsync({"level": level})) for level in range(5)]
+    return {
+        "ids": [rng.sample(ids, 40), rng.sample(ids, 3)],
+        "topics": [["goal"], ["goal", "belief"], ["desire", "missing"]],
+        "times": [[3, 20, 21, 40], [rng.randrange(1, 60)]],
+        "valuesHashes": [hashes[:1], hashes[1:4]],
+        "minTime": [10, 30],
+        "maxTime": [25, 50],
+        "valueWhere": [[{"path": "level", "op": ">=", "value": 3}], [{"path": "level", "op": "in", "value": [0, 4]}, {"path": "level", "op": "!=", "value": 4}]],
+        "cursor": [ids[0], ids[150], ids[-1], "missing"],
+        "limit": [1, 7],
+    }
+
+
+def queries(indexed):
+    choices = options(indexed)
+    names = list(choices)
+    # Every combination of the filters, each with one of its values.
+    rng = random.Random(3)
+    for present in itertools.product([False, True], repeat=len(names)):
+        filters = dict()
+        for name, used in zip(names, present):
+            if (used):
+                filters[name] = rng.choice(choices[name])
+        yield filters
+
+
+def test_same_events_as_linear_scan():
+    indexed = history()
+    accesses = set()
+    for filters in queries(indexed):
+        accesses.add(indexed.explain(filters)["access"])
+        assert [e.id for e in indexed.getEvents(filters)] == [e.id for e in linear(indexed, filters)], filters
+    # The combinations use every index.
+    assert accesses >= {"scan", "ids", "topics", "times", "valuesHashes", "timeRange", "valueWhere:0", None}
+
+
+def test_check_lists_only_unsatisfied_filters():
+    indexed = history()
+    assert indexed.explain({"topics": ["goal"]})["check"] == []
+    plan = indexed.explain({"topics": ["goal"], "maxTime": 2})
+    assert (plan["access"], plan["check"]) == ("timeRange", [])
+    plan = indexed.explain({"topics": ["goal"], "minTime": 58, "maxTime": 58})
+    assert (plan["access"], plan["check"]) == ("timeRange", ["minTime"])
+    plan = indexed.explain({"times": [7], "valueWhere": [{"path": "level", "op": "==", "value": 1}, {"path": "level", "op": "exists"}]})
+    assert plan["check"] == [name for name in ["times", "valueWhere:0", "valueWhere:1"] if not name in [plan["access"]] + plan["intersect"]]
+    ids = [e.id for e in indexed.events[:2]]
+    plan = indexed.explain({"ids": ids, "topics": ["goal"], "minTime": 0})
+    assert (plan["access"], plan["check"]) == ("ids", ["topics", "minTime"])
+
+
+if __name__ == "__main__":
+    test_same_events_as_linear_scan()
+    test_check_lists_only_unsatisfied_filters()
@@ -0,0 +1,82 @@
+import asyncio
+from src.goalEDP.storages.in_memory import InMemoryHistory
+from src.goalEDP.explainers.incremental_explainer import IncrementalExplainer
+from src.goalEDP.core import Event, EventHandler, EventBroker
+
+
+# The replay of the history by IncrementalExplainer must count each event once, even when it fails.
+# Run from the repository root: python -m pytest tests/test_incremental_replay.py
+
+class Doubler(EventHandler):
+    async def handleAsync(self):
+        return [Event("b", 2 * e.value) for e in self.eventQueueByTopic.get("a", [])]
+
+
+class FailingHistory(InMemoryHistory):
+    """
+    Publishes an event in the middle of the replay, then fails.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.broker = None
+
+    async def iterEventsAsync(self, filters: dict, batchSize: int = 1000):
+        async for event in super().iterEventsAsync(filters, batchSize):
+            yield event
+            if (self.broker is not None):
+                broker, self.broker = self.broker, None
+                # As "EventBroker.inputExternalEvents" does, from the loop of the replay.
+                published = Event("a", 99, time=event.time + 1, initTime=event.time + 1)
+                await self.addEventAsync(published)
+                broker._notifyListeners(published)
+                raise Exception("failed")
+
+
+def system(history):
+    handler = Doubler()
+    handler.subscribe(["a"])
+    handler.publish(["b"])
+    return handler, EventBroker([handler], history)
+
+
+def publish(handler, broker, values):
+    for value in values:
+        broker.inputExternalEvents([Event("a", value)])
+        asyncio.run(broker.processHandler(handler))
+
+
+def test_nothing_kept_before_the_replay():
+    history = InMemoryHistory()
+    handler, broker = system(history)
+    replaying = IncrementalExplainer(broker, history)
+    publish(handler, broker, [1, 2, 1])
+    assert len(replaying._incoming) == 0
+    live = IncrementalExplainer(broker, history, replayHistory=False)
+    publish(handler, broker, [3, 1])
+    causes = replaying.possibleCauses([history.events[-1]])
+    assert causes == {"a": {history.hasher.hash(1): 3 / 5}}
+    assert live.possibleCauses([history.events[-1]]) == {"a": {history.hasher.hash(1): 1 / 2}}
+
+
+def test_failed_replay_counts_incoming():
+    history = FailingHistory()
+    handler, broker = system(history)
+    explainer = IncrementalExplainer(broker, history)
+    publish(handler, broker, [1, 2])
+    history.broker = broker
+    error = None
+    try:
+        asyncio.run(explainer.updateAsync())
+    except Exception as e:
+        error = str(e)
+    assert error == "failed"
+    assert len(explainer._incoming) == 0
+    # The first event was replayed, and the one published during the replay was counted after it.
+    assert [seen.event.value for seen in explainer._recent["a"]] == [1, 99]
+    asyncio.run(explainer.updateAsync())
+
+
+if __name__ == "__main__":
+    test_nothing_kept_before_the_replay()
+    test_failed_replay_counts_incoming()
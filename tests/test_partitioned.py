@@ -0,0 +1,62 @@
+import sys
+from src.goalEDP.storages.in_memory import InMemoryHistory
+from src.goalEDP.storages.partitioned import PartitionedHistory
+from src.goalEDP.core import Event, EventHandler
+
+
+# PartitionedHistory must count and merge the events of its shards as a single History would.
+# Run from the repository root: python -m pytest tests/test_partitioned.py
+
+class CountingHistory(InMemoryHistory):
+    def __init__(self):
+        super().__init__()
+        self.counted = 0
+
+    async def countOutsAsync(self, handlers, minTime=0, maxTime=sys.maxsize):
+        self.counted += 1
+        return await super().countOutsAsync(handlers, minTime, maxTime)
+
+
+class Publisher(EventHandler):
+    async def handleAsync(self):
+        return []
+
+
+def histories(times):
+    partitioned = PartitionedHistory([CountingHistory() for _ in range(4)])
+    reference = InMemoryHistory()
+    topics = ["t" + str(i) for i in range(8)]
+    for n, time in enumerate(times):
+        event = Event(topics[n % len(topics)], n, time=time, initTime=time)
+        partitioned.addEvent(event)
+        reference.addEvent(event)
+    return partitioned, reference
+
+
+def test_count_outs_queries_owning_shards():
+    partitioned, reference = histories(range(1, 41))
+    handler = Publisher()
+    handler.publish(["t1", "t2"])
+    assert partitioned.countOuts([handler]) == reference.countOuts([handler])
+    owners = set(partitioned.shardOf(topic) for topic in ["t1", "t2"])
+    assert [shard.counted for shard in partitioned.shards] == [1 if i in owners else 0 for i in range(4)]
+
+
+def test_merge_sorts_the_shards():
+    # Times out of insertion order, so the shards are not sorted by time.
+    partitioned, reference = histories([(n * 7) % 13 + 1 for n in range(40)])
+    times = [e.time for e in partitioned.getEvents({})]
+    assert times == sorted(e.time for e in reference.events)
+    assert [e.time for e in partitioned.getEvents({"topics": ["t1", "t6"]})] == sorted(e.time for e in reference.getEvents({"topics": ["t1", "t6"]}))
+
+
+def test_cursor():
+    partitioned, _ = histories(range(1, 41))
+    ids = [e.id for e in partitioned.getEvents({})]
+    for position in (0, 5, 17):
+        assert [e.id for e in partitioned.getEvents({"cursor": ids[position]})] == ids[position + 1:]
+
+if __name__ == "__main__":
+    test_count_outs_queries_owning_shards()
+    test_merge_sorts_the_shards()
+    test_cursor()
@@ -0,0 +1,38 @@
+from src.goalEDP.storages.in_memory import InMemoryHistory
+from src.goalEDP.storages.run_length import RunLengthHistory
+from src.goalEDP.core import Event
+
+
+# RunLengthHistory must return the same events (with their original ids) as an InMemoryHistory.
+# Run from the repository root: python -m pytest tests/test_run_length.py
+
+def histories():
+    compact = RunLengthHistory()
+    reference = InMemoryHistory()
+    for i in range(60):
+        event = Event("belief" if i % 2 else "goal", i // 10, time=i + 1, initTime=i)
+        compact.addEvent(event)
+        reference.addEvent(event)
+    return compact, reference
+
+
+def rows(events):
+    return [(e.id, e.topic, e.value, e.time, e.initTime) for e in events]
+
+
+def test_ids_are_kept():
+    compact, reference = histories()
+    assert rows(compact.getEvents({})) == rows(reference.getEvents({}))
+    ids = [e.id for e in reference.events]
+    for filters in ({"ids": [ids[7], ids[30]]}, {"cursor": ids[40]}, {"cursor": ids[12], "topics": ["goal"], "limit": 5}):
+        assert rows(compact.getEvents(filters)) == rows(reference.getEvents(filters))
+
+
+def test_unknown_cursor():
+    compact, _ = histories()
+    assert compact.getEvents({"cursor": "7"}) == []
+
+
+if __name__ == "__main__":
+    test_ids_are_kept()
+    test_unknown_cursor()
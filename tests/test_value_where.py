@@ -0,0 +1,40 @@
+from src.goalEDP.storages.in_memory import InMemoryHistory
+from src.goalEDP.core import Event
+
+
+# Queries with 'valueWhere' must return the same events with and without a value index.
+# Run from the repository root: python -m pytest tests/test_value_where.py
+
+def histories():
+    indexed = InMemoryHistory()
+    indexed.createValueIndex("payment", "amount")
+    scanned = InMemoryHistory()
+    for i in range(20):
+        event = Event("payment", {"amount": i % 5}, time=i + 1, initTime=i)
+        indexed.addEvent(event)
+        scanned.addEvent(event)
+    return indexed, scanned
+
+
+def ids(events):
+    return [e.id for e in events]
+
+
+def test_in_with_equal_values():
+    indexed, scanned = histories()
+    for values in ([3, 3.0], [3, 3], [1, 3, 1.0, 3.0]):
+        filters = {"topics": ["payment"], "valueWhere": [{"path": "amount", "op": "in", "value": values}]}
+        assert indexed.explain(filters)["access"] == "valueWhere:0"
+        assert ids(indexed.getEvents(filters)) == ids(scanned.getEvents(filters))
+        assert len(set(ids(indexed.getEvents(filters)))) == len(indexed.getEvents(filters))
+
+
+def test_in_estimate_counts_each_event_once():
+    indexed, _ = histories()
+    filters = {"topics": ["payment"], "valueWhere": [{"path": "amount", "op": "in", "value": [3, 3.0]}]}
+    assert indexed.explain(filters)["estimates"]["valueWhere:0"] == 4
+
+
+if __name__ == "__main__":
+    test_in_with_equal_values()
+    test_in_estimate_counts_each_event_once()